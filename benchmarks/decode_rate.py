@@ -0,0 +1,95 @@
+""" Decode and encode rate of the read loop, in the loop and with decode workers.
+
+    python benchmarks/decode_rate.py [--seconds N] [--workers N ...] [--rates HZ ...]
+
+A synthetic capture with RXM-RAWX at each rate (64 signals per epoch) and NAV-HPPOSLLH at 1 Hz is framed from memory
+and decoded, and every minute of epochs is encoded with raw_packet, as the reader does. "loop" decodes in the loop
+like the default mode, "workers=N" goes through DecodePipeline. The speed is how many seconds of data are handled
+per second of wall time, so the highest sustainable RAWX rate is about speed times the rate of the capture.
+"""
+import os
+import time
+import struct
+import argparse
+from ublox.api import raw_packet
+from ublox.gpstime import second_of_minute
+from ublox.messages import NavHPPOSLLH, RxmRawx
+from ublox.pipeline import DecodePipeline, EncodedRawx
+from ublox.ublox_reader import UBXFramer
+from synthetic import capture
+
+MSG_DICT = {RxmRawx.id: RxmRawx, NavHPPOSLLH.id: NavHPPOSLLH}
+
+
+def raw_packet_concat(messages):
+    """ raw_packet as it was, adding every record to a bytes object. """
+    packet = b''
+    for i in messages:
+        packet = packet + struct.pack('<dHbB', i.rcvTow, i.week, i.leapS, i.numMeas)
+        for j in i.satellites:
+            for k in j:
+                cno = min(max(int(k.cno/6), 1), 9)
+                other = ((k.gnssId & 0x07) << 12) | ((k.svId & 0x3f) << 6) | ((k.sigId & 0x07) << 3) | (cno & 0x07)
+                packet = packet + struct.pack('<ddfH', k.prMeas, k.cpMeas, k.doMeas, other)
+    return packet
+
+
+def run(data, workers, encode=raw_packet):
+    """ Frame, decode and encode data. Returns (seconds, epochs, measurements, minutes). """
+    framer = UBXFramer()
+    pipeline = DecodePipeline(MSG_DICT, workers) if workers is not None else None
+    raw, prev = [], 0
+    epochs = meas = minutes = 0
+
+    def handle(packet):
+        nonlocal raw, prev, epochs, meas, minutes
+        if isinstance(packet, (RxmRawx, EncodedRawx)):
+            mod = second_of_minute(packet.rcvTow, packet.leapS)
+            if mod < prev:
+                encode(raw)
+                minutes += 1
+                raw = []
+            raw.append(packet)
+            prev = mod
+            epochs += 1
+            meas += packet.numMeas
+
+    start = time.perf_counter()
+    for i in range(0, len(data), 4096):  # Serial reads arrive in pieces
+        for msg_id, payload in framer.feed(data[i:i + 4096]):
+            if pipeline:
+                for packet in pipeline.feed(msg_id, payload):
+                    handle(packet)
+            else:
+                handle(MSG_DICT[msg_id](payload))
+    if pipeline:
+        for packet in pipeline.flush():
+            handle(packet)
+    encode(raw)
+    elapsed = time.perf_counter() - start
+    if pipeline:
+        pipeline.close()
+    return elapsed, epochs, meas, minutes + 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=120, help='Seconds of data at each rate')
+    parser.add_argument('--rates', type=int, nargs='+', default=[10, 20])
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, max((os.cpu_count() or 1) - 1, 1)])
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} CPUs')
+    for rate in args.rates:
+        data = capture(args.seconds, rate=rate, tow=3600.)
+        modes = [('loop, concatenating raw_packet', None, raw_packet_concat), ('loop', None, raw_packet)]
+        modes += [(f'workers={w}', w, raw_packet) for w in args.workers]
+        for name, workers, encode in modes:
+            elapsed, epochs, meas, minutes = run(data, workers, encode)
+            speed = args.seconds / elapsed
+            print(f'{rate:3d} Hz  {name:31s} {epochs / elapsed:8.0f} epochs/s {meas / elapsed:9.0f} meas/s  '
+                  f'{speed:5.1f}x real time, sustains {speed * rate:6.0f} Hz')
+
+
+if __name__ == '__main__':
+    main()
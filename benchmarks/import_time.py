@@ -0,0 +1,43 @@
+""" Cold start import time of the decode core and of the daemon.
+
+    python benchmarks/import_time.py [--repeat N]
+
+Each module is imported in a fresh interpreter with -X importtime and the cumulative time of the module is reported,
+along with the heavy dependencies that were pulled in by it.
+"""
+import re
+import sys
+import argparse
+import subprocess
+
+
+MODULES = ['ublox.messages', 'ublox.ublox_reader', 'ublox._main', 'ublox.__main__']
+HEAVY = ['numpy', 'serial', 'requests', 'jwt', 'diskcache', 'RPi']
+
+
+def import_time(module):
+    """ Cumulative import time in microseconds of a module and the heavy modules it imported. """
+    code = f'import sys, {module}; print(",".join(m for m in {HEAVY!r} if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)', line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    return times[module], result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for module in MODULES:
+        runs = [import_time(module) for _ in range(args.repeat)]
+        best = min(i[0] for i in runs)
+        print(f'{module:20s} {best / 1000:8.1f} ms  heavy imports: {runs[0][1] or "none"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+""" Throughput of the RINEX observation export on a synthetic capture.
+
+    python benchmarks/rinex_throughput.py [--hours H] [--rate HZ] [--jobs N]
+"""
+import os
+import time
+import argparse
+import tempfile
+from ublox.rinex import convert
+from synthetic import capture
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=float, default=1.)
+    parser.add_argument('--rate', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'capture.ubx')
+        with open(src, 'wb') as f:
+            for hour in range(int(args.hours * 60)):  # Write a minute at a time
+                f.write(capture(60, args.rate, tow=60. * hour))
+        epochs = int(args.hours * 3600 * args.rate)
+        print(f'{epochs} epochs, {os.path.getsize(src) / 1e6:.1f} MB of UBX')
+        for jobs in sorted({1, args.jobs}):
+            start = time.perf_counter()
+            convert(src, os.path.join(tmp, 'capture.rnx'), workers=jobs)
+            elapsed = time.perf_counter() - start
+            print(f'{jobs:3d} workers: {elapsed:7.2f} s, {epochs / elapsed:9.0f} epochs/s, '
+                  f'{elapsed * 24 / args.hours:7.1f} s per day')
+
+
+if __name__ == '__main__':
+    main()
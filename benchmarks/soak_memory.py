@@ -0,0 +1,136 @@
+""" Long-run memory soak of the minute handling of the reader, with uploads to the local ingest stand-in.
+
+    python benchmarks/soak_memory.py [--hours N] [--rate HZ] [--legacy] [--no-tracemalloc] [--rss-limit MB]
+
+Synthetic RXM-RAWX and NAV-HPPOSLLH packets are fed as fast as possible through the memory bounded path
+(MinuteCollector and pooled buffers) or, with --legacy, through the RxmRawx object lists and raw_packet of the
+default loop. Closed minutes are uploaded by AdaptiveUploaders to an IngestServer. Once per simulated hour the
+resident memory, the memory and number of blocks traced by tracemalloc and the upload counters are printed.
+"""
+import gc
+import time
+import struct
+import argparse
+import tempfile
+import tracemalloc
+import diskcache as dc
+from ublox.api import _POS_SIZE, pos_packet, raw_packet, raw_record_offsets, pos_record_offsets, save_to_dc
+from ublox.gpstime import second_of_minute
+from ublox.ingest import IngestServer
+from ublox.messages import NavHPPOSLLH, RxmRawx
+from ublox.minute import BufferPool, MinuteCollector, rss_bytes
+from ublox.uploader import AdaptiveUploader
+from synthetic import hpposllh_payload, rawx_payload
+from upload_throughput import keys
+
+
+class Legacy:
+    """ Minute handling of the default reader loop, with the same interface as MinuteCollector. """
+    def __init__(self):
+        self._raw, self._pos = [], []
+        self._prev_raw, self._prev_pos = 0, 0
+        self.week, self.leapS = None, None
+
+    def feed(self, msg_id, payload):
+        done = []
+        if msg_id == RxmRawx.id:
+            packet = RxmRawx(payload)
+            mod_raw = second_of_minute(packet.rcvTow, packet.leapS)
+            if mod_raw < self._prev_raw:
+                done.append(('raw', raw_packet(self._raw), None))
+                self._raw = []
+            self._raw.append(packet)
+            self._prev_raw = mod_raw
+            self.week, self.leapS = packet.week, packet.leapS
+        elif msg_id == NavHPPOSLLH.id and self.leapS:
+            packet = NavHPPOSLLH(payload)
+            mod_pos = second_of_minute(packet.iTOW / 1000, self.leapS)
+            if mod_pos < self._prev_pos:
+                done.append(('pos', pos_packet(self._pos, self.week, self.leapS), None))
+                self._pos = []
+            self._pos.append(packet)
+            self._prev_pos = mod_pos
+        return done
+
+
+def traced_blocks():
+    """ Number of live memory blocks allocated since tracemalloc was started. """
+    return sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--rate', type=int, default=10)
+    parser.add_argument('--legacy', action='store_true', help='Use packet object lists instead of the bounded path')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='Skip tracemalloc, which slows the run down')
+    parser.add_argument('--rss-limit', type=float, default=256, help='MB above which minutes go to the cache')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of the ingest stand-in')
+    args = parser.parse_args()
+
+    private, public = keys()
+    server = IngestServer({'test': public}, latency=args.latency, keep=False).start()
+    spool = tempfile.TemporaryDirectory()
+    cache_raw, cache_pos = dc.Cache(spool.name + '/raw'), dc.Cache(spool.name + '/pos')
+    up_raw = AdaptiveUploader(server.url + 'rawgps/test', private, cache_raw, raw_record_offsets).start()
+    up_pos = AdaptiveUploader(server.url + 'posgps/test', private, cache_pos, pos_record_offsets, min_bytes=_POS_SIZE,
+                              max_bytes=_POS_SIZE).start()
+
+    pool = BufferPool(4, 1200 * 12 + 76800 * 22)
+    collector = Legacy() if args.legacy else MinuteCollector(pool)
+    rss_limit = args.rss_limit * 2**20
+    spooled = 0
+
+    def dispatch(kind, data, buff):
+        nonlocal spooled
+        uploader, cache = (up_raw, cache_raw) if kind == 'raw' else (up_pos, cache_pos)
+        done = (lambda: pool.release(buff)) if buff is not None else None
+        if (kind == 'raw' and buff is None and not args.legacy) or rss_bytes() > rss_limit:
+            save_to_dc(cache, time.time(), bytes(data))
+            spooled += 1
+            if done:
+                done()
+        else:
+            uploader.submit(time.time(), data, done)
+
+    # One minute of payloads, the time of week is patched in for every minute
+    minute = [bytearray(rawx_payload(2100, 0., k=k)) for k in range(60 * args.rate)]
+    positions = [bytearray(hpposllh_payload(0)) for _ in range(60)]
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    print('hour   rss MB  traced MB  peak MB    blocks  posts sent  minutes spooled  s/hour')
+    tow = 3600.  # Start an hour into the week, so positions minus leap seconds stay positive
+    for hour in range(1, args.hours + 1):
+        start = time.perf_counter()
+        for _ in range(60):
+            for k, payload in enumerate(minute):
+                t = tow + k / args.rate
+                struct.pack_into('<d', payload, 0, t)
+                for m in collector.feed(RxmRawx.id, payload):
+                    dispatch(*m)
+                if k % args.rate == 0:
+                    pos = positions[k // args.rate]
+                    struct.pack_into('<I', pos, 4, int(t * 1000))
+                    for m in collector.feed(NavHPPOSLLH.id, pos):
+                        dispatch(*m)
+            tow += 60.
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        if args.no_tracemalloc:
+            traced, peak, blocks = 0, 0, 0
+        else:
+            traced, peak = tracemalloc.get_traced_memory()
+            blocks = traced_blocks()
+        sent = server.stats['accepted']
+        print(f'{hour:4d} {rss_bytes() / 2**20:8.1f} {traced / 2**20:10.2f} {peak / 2**20:8.2f} {blocks:9d} '
+              f'{sent:11d} {spooled:16d} {elapsed:7.1f}', flush=True)
+
+    up_raw.stop(10)
+    up_pos.stop(10)
+    server.close()
+    spool.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+""" Synthetic UBX capture data for the benchmarks. """
+import struct
+from ublox.messages import RxmRawx, NavHPPOSLLH
+from ublox.ublox_writer import UBXWriter
+
+
+# (gnssId, svId range, sigIds) of a typical multi-GNSS F9P sky
+SKY = [(0, range(1, 11), (0, 3)), (2, range(1, 9), (0, 6)), (3, range(6, 14), (0, 2)), (6, range(1, 8), (0, 2)),
+       (1, range(123, 126), (0,))]
+
+
+class _Buffer:
+    """ File-like collector of written packets. """
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+
+def rawx_payload(week, tow, leapS=18, sky=SKY, k=0):
+    """ UBX-RXM-RAWX payload for one epoch. """
+    meas = [(gnss, sv, sig) for gnss, svs, sigs in sky for sv in svs for sig in sigs]
+    parts = [struct.pack('<dHbBBBH', tow, week, leapS, len(meas), 1, 1, 0)]
+    for gnss, sv, sig in meas:
+        parts.append(struct.pack('<ddfBBBBHBBBBBB', 2.2e7 + 1000. * sv + 0.1 * k, 1.1e8 + 5000. * sv + k,
+                                 -1234.5 + sv, gnss, sv, sig, 7 if gnss == 6 else 0, min(64500, 100 + 200 * k),
+                                 30 + sv % 20, 3, 2, 4, 0x0f, 0))
+    return b''.join(parts)
+
+
+def hpposllh_payload(itow):
+    """ UBX-NAV-HPPOSLLH payload. """
+    return struct.pack('<BBBBLllllbbbbLL', 0, 0, 0, 0, itow, -1052702000, 400123000, 1650000, 1670000, 1, 2, 3, 4,
+                       140, 200)
+
+
+def capture(seconds, rate=5, week=2100, tow=0.):
+    """ Bytes of a capture with RAWX at rate Hz and HPPOSLLH at 1 Hz for a number of seconds. """
+    buff = _Buffer()
+    writer = UBXWriter(buff, {})
+    for k in range(int(seconds * rate)):
+        t = tow + k / rate
+        writer.write_packet(rawx_payload(week, t, k=k), RxmRawx.id)
+        if k % rate == 0:
+            writer.write_packet(hpposllh_payload(int(t * 1000)), NavHPPOSLLH.id)
+    return b''.join(buff.parts)
@@ -0,0 +1,69 @@
+""" Upload throughput and backlog drain against the local ingest stand-in.
+
+    python benchmarks/upload_throughput.py [--minutes N] [--latency S] [--error-rate R] [--outage SECONDS]
+
+A backlog of synthetic minutes is submitted to an AdaptiveUploader pointed at a local IngestServer. The time to drain
+it, the achieved goodput and the final batch size are reported, and every decoded epoch is compared with what was
+sent.
+"""
+import time
+import argparse
+import numpy as np
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from ublox.api import raw_packet, raw_record_offsets
+from ublox.ingest import IngestServer
+from ublox.messages import RxmRawx
+from ublox.uploader import AdaptiveUploader
+from synthetic import rawx_payload
+
+
+def keys():
+    """ New (private, public) PEM key pair. """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption()).decode()
+    public = key.public_key().public_bytes(serialization.Encoding.PEM,
+                                           serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    return private, public
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--minutes', type=int, default=30)
+    parser.add_argument('--rate', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--outage', type=float, default=0.)
+    args = parser.parse_args()
+
+    private, public = keys()
+    server = IngestServer({'test': public}, latency=args.latency, error_rate=args.error_rate, seed=0).start()
+    uploader = AdaptiveUploader(server.url + 'rawgps/test', private, {}, raw_record_offsets,
+                                max_inflight=1 << 30).start()
+    if args.outage:
+        server.outage(args.outage)
+
+    tows = []
+    for minute in range(args.minutes):
+        packets = [RxmRawx(rawx_payload(2100, 60. * minute + k / args.rate, k=k)) for k in range(60 * args.rate)]
+        tows.extend(i.rcvTow for i in packets)
+        uploader.submit(minute, raw_packet(packets))
+    start = time.perf_counter()  # Uploads overlap with building the backlog, so this is an upper bound on goodput
+    while uploader.metrics['bytes_queued']:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    uploader.stop()
+    metrics = uploader.metrics
+    server.close()
+
+    received = np.concatenate([i['rcvTow'] for i in server.received[('rawgps', 'test')]])
+    print(f'{args.minutes} minutes in {elapsed:.2f} s, {metrics["bytes_sent"] / elapsed / 1e6:.2f} MB/s overall, '
+          f'{(metrics["goodput_bps"] or 0) / 1e6:.2f} MB/s per POST')
+    print(f'{metrics["posts"]} POSTs, {metrics["failures"]} failed, final batch {metrics["batch_bytes"]} bytes')
+    print(f'Round trip {"ok" if np.array_equal(np.sort(received), np.sort(tows)) else "MISMATCH"}: '
+          f'{len(received)} epochs received, {len(tows)} sent')
+
+
+if __name__ == '__main__':
+    main()
@@ -22,13 +22,13 @@ setup(
     author_email='Adam.Dodge@Colorado.edu',
     description='Set of tools for receiving data from F9P GPS. ',
     long_description=read('README.rst'),
-    scripts=['bin/ublox'],
+    scripts=['bin/ublox', 'bin/ublox-rinex'],
     license='custom',
     url='https://github.com/ccarocean/ublox',
     packages=find_packages(),
+    python_requires='>=3.9',
     install_requires=[
         'pyserial',
-        'dataclasses;python_version=="3.6"',
         'pyjwt[crypto]',
         'requests',
         'RPi.GPIO',
@@ -40,8 +40,10 @@ setup(
         'Intended Audience :: Science/Research',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Programming Language :: Python :: Implementation :: CPython',
         'Topic :: Scientific/Engineering',
         'Topic :: Scientific/Engineering :: GIS'
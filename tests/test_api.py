@@ -0,0 +1,116 @@
+import random
+import numpy as np
+import pytest
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from ublox.api import decode_pos_packet, decode_raw_packet, pos_packet, raw_packet, sign
+from ublox.ingest import IngestServer
+from ublox.messages import NavHPPOSLLH, RxmRawx
+from test_minute import LEAP, WEEK, hpposllh_payload, payloads, rawx_payload  # noqa: F401
+
+
+def key_pair():
+    """ New RSA key pair as (private, public) PEM. """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return (key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                              serialization.NoEncryption()).decode(),
+            key.public_key().public_bytes(serialization.Encoding.PEM,
+                                          serialization.PublicFormat.SubjectPublicKeyInfo).decode())
+
+
+@pytest.fixture(scope='module')
+def keys():
+    return key_pair()
+
+
+@pytest.fixture
+def server(keys):
+    server = IngestServer({'test': keys[1]}).start()
+    yield server
+    server.close()
+
+
+def post(server, path, data, token):
+    headers = {'Content-Type': 'application/octet-stream'}
+    if token is not None:
+        headers['Bearer'] = token
+    return requests.post(server.url + path, data=data, headers=headers, timeout=5).status_code
+
+
+def test_decode_raw_packet_round_trip(payloads):
+    packets = [RxmRawx(i) for i in payloads]
+    decoded = decode_raw_packet(raw_packet(packets))
+    np.testing.assert_array_equal(decoded['rcvTow'], [i.rcvTow for i in packets])
+    np.testing.assert_array_equal(decoded['week'], WEEK)
+    np.testing.assert_array_equal(decoded['leapS'], LEAP)
+    np.testing.assert_array_equal(decoded['numMeas'], [i.numMeas for i in packets])
+
+    meas = [(e, m) for e, i in enumerate(packets) for sat in i.satellites for m in sat]
+    np.testing.assert_array_equal(decoded['epoch'], [e for e, _ in meas])
+    for name in ('prMeas', 'cpMeas', 'gnssId', 'sigId'):
+        np.testing.assert_array_equal(decoded[name], [getattr(m, name) for _, m in meas])
+    np.testing.assert_array_equal(decoded['doMeas'], np.array([m.doMeas for _, m in meas], dtype=np.float32))
+    np.testing.assert_array_equal(decoded['svId'], [m.svId & 0x3f for _, m in meas])
+    np.testing.assert_array_equal(decoded['cno'], [min(max(m.cno // 6, 1), 9) & 0x07 for _, m in meas])
+
+
+def test_decode_raw_packet_truncated(payloads):
+    data = raw_packet([RxmRawx(payloads[0])])
+    with pytest.raises(ValueError):
+        decode_raw_packet(data[:-1])
+
+
+def test_decode_pos_packet_round_trip():
+    rnd = random.Random(2)
+    packets = [NavHPPOSLLH(hpposllh_payload(3600000 + 1000 * k, rnd)) for k in range(60)]
+    decoded = decode_pos_packet(pos_packet(packets, WEEK, LEAP) + pos_packet(packets[:10], WEEK, LEAP))
+    assert decoded['iTOW'][0] == int(np.mean([i.iTOW for i in packets]) - LEAP * 1000)
+    np.testing.assert_array_equal(decoded['week'], WEEK)
+    assert decoded['lon'][1] == np.mean([i.lon for i in packets[:10]])
+    assert decoded['height'][0] == np.mean([i.height for i in packets])
+    with pytest.raises(ValueError):
+        decode_pos_packet(b'\0' * 31)
+
+
+def test_ingest_accepts_and_keeps_bodies(server, keys, payloads):
+    packets = [RxmRawx(i) for i in payloads]
+    assert post(server, 'rawgps/test', raw_packet(packets), sign(keys[0])) == 201
+    rnd = random.Random(3)
+    positions = [NavHPPOSLLH(hpposllh_payload(3600000 + 1000 * k, rnd)) for k in range(60)]
+    assert post(server, 'posgps/test', pos_packet(positions, WEEK, LEAP), sign(keys[0])) == 201
+
+    raw, = server.received[('rawgps', 'test')]
+    np.testing.assert_array_equal(raw['rcvTow'], [i.rcvTow for i in packets])
+    assert len(raw['prMeas']) == sum(i.numMeas for i in packets)
+    pos, = server.received[('posgps', 'test')]
+    assert pos['lat'][0] == np.mean([i.lat for i in positions])
+    stats = server.stats
+    assert (stats['accepted'], stats['epochs'], stats['measurements']) == (2, len(packets), len(raw['prMeas']))
+
+
+def test_ingest_rejects_bad_key(server, keys, payloads):
+    data = raw_packet([RxmRawx(payloads[0])])
+    assert post(server, 'rawgps/test', data, sign(key_pair()[0])) == 401  # Signed with another key
+    assert post(server, 'rawgps/test', data, None) == 401
+    assert post(server, 'rawgps/other', data, sign(keys[0])) == 401  # Location without a key
+    assert post(server, 'other/test', data, sign(keys[0])) == 404
+    assert server.stats['unauthorized'] == 3
+    assert server.received == {}
+
+
+def test_ingest_rejects_truncated_body(server, keys, payloads):
+    data = raw_packet([RxmRawx(i) for i in payloads[:2]])
+    assert post(server, 'rawgps/test', data[:-1], sign(keys[0])) == 400
+    assert post(server, 'posgps/test', bytes(31), sign(keys[0])) == 400
+    assert server.stats['bad_request'] == 2
+    assert server.received == {}
+
+
+def test_ingest_outage(server, keys, payloads):
+    data = raw_packet([RxmRawx(payloads[0])])
+    server.outage(60)
+    assert post(server, 'rawgps/test', data, sign(keys[0])) == 503
+    assert server.stats['outage_rejects'] == 1
+    server.outage(0)
+    assert post(server, 'rawgps/test', data, sign(keys[0])) == 201
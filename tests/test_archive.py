@@ -0,0 +1,60 @@
+import os
+import struct
+import numpy as np
+from ublox.archive import STREAMS, ArchiveReader, ArchiveWriter
+from ublox.gpstime import gps_seconds
+
+WEEK = 2100
+SKY = [(0, 5, 0), (2, 3, 0), (6, 4, 2)]
+
+
+def rawx_payload(tow):
+    parts = [struct.pack('<dHbBBBH', tow, WEEK, 18, len(SKY), 1, 1, 0)]
+    for gnss, sv, sig in SKY:
+        parts.append(struct.pack('<ddfBBBBHBBBBBB', 2.2e7 + tow, 1.1e8, 100., gnss, sv, sig, 7, 1000, 40, 3, 2, 4,
+                                 0x0f, 0))
+    return b''.join(parts)
+
+
+def test_append_and_load_days(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    tows = [86400. * 2 - 120 + 30 * k for k in range(8)]  # Four epochs on each side of midnight
+    for k, tow in enumerate(tows):
+        writer.append_rawx_payload(rawx_payload(tow))
+        if k % 2:
+            writer.flush()
+    writer.close()
+
+    reader = ArchiveReader(str(tmp_path))
+    assert reader.days() == ['2020-04-06', '2020-04-07']
+    # Every flush appends to the same file of each column, which np.load can map directly
+    day = os.path.join(str(tmp_path), '2020-04-06', 'rawx')
+    assert len(os.listdir(day)) == len(STREAMS['rawx'])
+    column = np.load(os.path.join(day, 'rcvTow.npy'), mmap_mode='r')
+    assert isinstance(column, np.memmap)
+    np.testing.assert_array_equal(column, np.repeat(tows[:4], len(SKY)))
+
+    chunks = reader.load('rawx', columns=['t', 'prMeas'])
+    assert len(chunks) == 2  # One set of memory maps per day, not one copy of the range
+    assert all(isinstance(i['prMeas'], np.memmap) for i in chunks)
+    np.testing.assert_array_equal(np.concatenate([i['prMeas'] for i in chunks]), np.repeat(2.2e7 + np.array(tows),
+                                                                                             len(SKY)))
+    start, stop = (float(gps_seconds(WEEK, tows[i])) for i in (3, 5))
+    chunks = reader.load('rawx', start, stop)
+    np.testing.assert_array_equal(np.concatenate([i['rcvTow'] for i in chunks]), np.repeat(tows[3:5], len(SKY)))
+
+
+def test_rows_of_a_crash_are_cut_off(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append_rawx_payload(rawx_payload(3600.))
+    writer.close()
+    path = os.path.join(str(tmp_path), '2020-04-05', 'rawx', 't.npy')
+    with open(path, 'ab') as f:  # Data of a flush that crashed before its header was updated
+        f.write(bytes(8 * len(SKY)))
+
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append_rawx_payload(rawx_payload(3630.))
+    writer.close()
+    chunk, = ArchiveReader(str(tmp_path)).load('rawx')
+    np.testing.assert_array_equal(chunk['rcvTow'], np.repeat([3600., 3630.], len(SKY)))
+    assert np.load(path).shape == (2 * len(SKY),)
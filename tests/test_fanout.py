@@ -0,0 +1,91 @@
+import os
+import struct
+import itertools
+import pytest
+from ublox.fanout import _HEADER_SIZE, _SLOT, RingPublisher, RingSubscriber
+
+_names = itertools.count()
+
+
+@pytest.fixture
+def ring():
+    """ Publisher of a ring with 4 slots of 16 bytes and a subscriber that starts at the oldest frame. """
+    pub = RingPublisher(f'ubxtest{os.getpid()}_{next(_names)}', slots=4, slot_size=16)
+    sub = RingSubscriber(pub.name, latest=False)
+    yield pub, sub
+    sub.close()
+    pub.close()
+
+
+def payload(k):
+    return bytes([k]) * (k % 16 + 1)
+
+
+def test_read_in_order(ring):
+    pub, sub = ring
+    assert sub.read() is None
+    for k in range(3):
+        assert pub.publish(0x0215, payload(k))
+    frames = [sub.read() for _ in range(3)]
+    assert [(f.seq, f.msg_id, bytes(f.payload)) for f in frames] == [(k + 1, 0x0215, payload(k)) for k in range(3)]
+    assert sub.read() is None
+    assert sub.lag == 0
+    assert frames[0].payload.readonly
+    del frames
+
+
+def test_oversized_payload_dropped(ring):
+    pub, sub = ring
+    assert not pub.publish(1, bytes(17))
+    assert pub.dropped == 1
+    assert sub.read() is None
+
+
+def test_wrap_around_and_overruns(ring):
+    pub, sub = ring
+    for k in range(10):  # Two and a half laps, the subscriber is more than a ring behind
+        pub.publish(1, payload(k))
+    assert sub.lag == 10
+    frames = [sub.read() for _ in range(4)]
+    assert [f.seq for f in frames] == [7, 8, 9, 10]  # Skipped to the oldest frame still in the ring
+    assert [bytes(f.payload) for f in frames] == [payload(k) for k in range(6, 10)]
+    assert sub.overruns == 6
+    assert sub.read() is None
+    del frames
+
+
+def test_intact_after_lap(ring):
+    pub, sub = ring
+    pub.publish(1, payload(0))
+    frame = sub.read()
+    assert sub.intact(frame)
+    for k in range(1, 4):
+        pub.publish(1, payload(k))
+    assert sub.intact(frame)  # Still in the ring
+    pub.publish(1, payload(4))  # Overwrites the slot of the first frame
+    assert not sub.intact(frame)
+    assert bytes(frame.payload) == payload(4)[:len(frame.payload)]
+    del frame
+
+
+def test_half_written_slot_skipped(ring):
+    pub, sub = ring
+    for k in range(3):
+        pub.publish(1, payload(k))
+    # Clear the sequence number of the second slot like the publisher does while it writes the slot
+    offset = _HEADER_SIZE + 2 * (_SLOT.size + 16)
+    struct.pack_into('<Q', pub._buf, offset, 0)
+    assert sub.read().seq == 1
+    assert sub.read().seq == 3
+    assert sub.overruns == 1
+
+
+def test_close_with_frames_alive(ring):
+    pub, sub = ring
+    pub.publish(1, payload(0))
+    frame = sub.read()
+    with pytest.raises(BufferError):
+        sub.close()
+    assert bytes(frame.payload) == payload(0)  # Still mapped
+    del frame
+    sub.close()
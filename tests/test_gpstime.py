@@ -0,0 +1,86 @@
+import struct
+import numpy as np
+from ublox.gpstime import GPS_EPOCH_UNIX, J2000_UNIX, SECONDS_IN_WEEK, gps_seconds, gps_to_j2000, gps_to_unix, \
+    gps_to_utc, leap_seconds, leap_seconds_unix, rawx_to_unix, second_of_minute, unix_to_datetime64, unix_to_gps, \
+    unroll_week, utc_to_unix
+from ublox.messages import RxmRawx
+
+LEAP_2017 = 1483228800  # 2017-01-01 00:00:00 UTC, when GPS - UTC became 18 s
+
+
+def test_epochs():
+    assert utc_to_unix(1980, 1, 6, 0, 0, 0) == GPS_EPOCH_UNIX
+    assert utc_to_unix(2000, 1, 1, 12, 0, 0) == J2000_UNIX
+    assert gps_to_unix(0, 0.) == GPS_EPOCH_UNIX
+
+
+def test_leap_second_table_boundaries():
+    assert leap_seconds_unix(LEAP_2017 - 1) == 17
+    assert leap_seconds_unix(LEAP_2017) == 18
+    assert leap_seconds_unix(362793600 - 1) == 0  # Before the first leap second, 1981-07-01
+    assert leap_seconds_unix(362793600) == 1
+    np.testing.assert_array_equal(leap_seconds_unix([GPS_EPOCH_UNIX, 915148800, 2e9]), [0, 13, 18])
+    gps = LEAP_2017 - GPS_EPOCH_UNIX + 18  # Same instant in GPS seconds
+    assert leap_seconds(gps - 1) == 17
+    assert leap_seconds(gps) == 18
+
+
+def test_gps_to_utc():
+    assert gps_to_utc(1930, 18.) == np.datetime64('2017-01-01T00:00:00')
+    assert gps_to_unix(1930, 18.) == LEAP_2017
+    assert gps_to_unix(1930, 18., leapS=17) == LEAP_2017 + 1  # Receiver offset is used when given
+    # The leap second itself maps onto the start of the next minute, like utc_to_unix with sec == 60
+    assert gps_to_unix(1930, 17.) == LEAP_2017
+    np.testing.assert_array_equal(gps_to_utc([1930, 1930], [18.5, 78.]),
+                                  np.array(['2017-01-01T00:00:00.5', '2017-01-01T00:01:00'], dtype='datetime64[ns]'))
+
+
+def test_gps_to_j2000():
+    assert gps_to_j2000(1042, 561613., leapS=13) == 0.
+    assert gps_to_j2000(1042, 561613.) == 0.  # Table gives 13 s in 1999
+    assert gps_to_j2000(1042, 561614.5, leapS=13) == 1.5
+
+
+def test_unix_to_gps():
+    week, tow = unix_to_gps(LEAP_2017)
+    assert (week, tow) == (1930, 18.)
+    week, tow = unix_to_gps(np.array([GPS_EPOCH_UNIX, GPS_EPOCH_UNIX + SECONDS_IN_WEEK - 0.5]))
+    np.testing.assert_array_equal(week, [0, 0])
+    np.testing.assert_array_equal(tow, [0., SECONDS_IN_WEEK - 0.5])
+
+
+def test_gps_seconds_roll_over():
+    assert gps_seconds(2100, -1.) == gps_seconds(2099, SECONDS_IN_WEEK - 1.)
+    assert gps_seconds(2100, SECONDS_IN_WEEK) == gps_seconds(2101, 0.)
+
+
+def test_unroll_week():
+    assert unroll_week(1930 % 1024, ref_week=2100) == 1930
+    assert unroll_week(2100 % 1024, ref_week=2100) == 2100
+    assert unroll_week(1023, ref_week=2048) == 2047  # Just before the 2019 rollover
+    assert unroll_week(0, ref_week=2047) == 2048
+    assert unroll_week(2100, ref_week=2100) == 2100  # Full week numbers are kept
+    np.testing.assert_array_equal(unroll_week([1000, 20], ref_week=2040), [2024, 2068])
+
+
+def test_utc_to_unix():
+    assert utc_to_unix(2016, 12, 31, 23, 59, 60) == LEAP_2017  # Leap second
+    assert utc_to_unix(2017, 1, 1, 0, 0, 0, -500000000) == LEAP_2017 - 0.5  # Negative nano, as in NAV-TIMEUTC
+    assert utc_to_unix(2017, 1, 1, 0, 0, 1, 250000000) == LEAP_2017 + 1.25
+    np.testing.assert_array_equal(utc_to_unix([2020, 2021], [2, 3], [29, 1], 0, 0, 0),
+                                  [1582934400, 1614556800])  # Leap day, and the day after February
+
+
+def test_second_of_minute():
+    assert second_of_minute(18., 18) == 0.
+    assert second_of_minute(17.5, 18) == 59.5
+
+
+def test_unix_to_datetime64():
+    assert unix_to_datetime64(LEAP_2017 + 0.25) == np.datetime64('2017-01-01T00:00:00.25')
+    assert unix_to_datetime64(-0.5) == np.datetime64('1969-12-31T23:59:59.5')
+
+
+def test_rawx_to_unix():
+    packets = [RxmRawx(struct.pack('<dHbBBBH', tow, 1930, 18, 0, 1, 1, 0)) for tow in (18., 18.2)]
+    np.testing.assert_allclose(rawx_to_unix(packets), [LEAP_2017, LEAP_2017 + 0.2])
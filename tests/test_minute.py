@@ -0,0 +1,99 @@
+import random
+import struct
+import pytest
+from ublox.api import pos_packet, raw_packet
+from ublox.messages import NavHPPOSLLH, RxmRawx
+from ublox.minute import BufferPool, MinuteCollector, RawMinute
+
+# (gnssId, svIds, sigIds) with GLONASS at an unknown slot (255), SBAS (svId - 100 in the key) and satellites whose
+# keys sort differently from their gnssId
+SKY = [(6, (255, 3, 24), (0, 2)), (0, (1, 5, 32), (0, 3)), (1, (123, 131), (0,)), (3, (6, 12, 46), (0, 2)),
+       (2, (1, 9, 36), (0, 6))]
+WEEK = 2100
+LEAP = 18
+
+
+def rawx_payload(tow, rnd):
+    """ RXM-RAWX payload with the measurements of SKY in random order, some of them repeated so that ties in the
+        sort order show up, and C/N0 over the whole range so that the wrap of the 3 bit field is covered. """
+    meas = [(gnss, sv, sig) for gnss, svs, sigs in SKY for sv in svs for sig in sigs]
+    meas += rnd.sample(meas, 4)
+    rnd.shuffle(meas)
+    parts = [struct.pack('<dHbBBBH', tow, WEEK, LEAP, len(meas), 1, 1, 0)]
+    for gnss, sv, sig in meas:
+        parts.append(struct.pack('<ddfBBBBHBBBBBB', rnd.uniform(2e7, 2.6e7), rnd.uniform(-1e8, 1e8),
+                                 rnd.uniform(-4000, 4000), gnss, sv, sig, 7, rnd.randrange(65536),
+                                 rnd.randrange(64), rnd.randrange(16), rnd.randrange(16), rnd.randrange(16),
+                                 rnd.randrange(16), 0))
+    return b''.join(parts)
+
+
+def hpposllh_payload(itow, rnd):
+    return struct.pack('<BBBBLllllbbbbLL', 0, 0, 0, 0, itow, rnd.randrange(-1800000000, 1800000000),
+                       rnd.randrange(-900000000, 900000000), rnd.randrange(10**6), rnd.randrange(10**6), 1, 2, 3, 4,
+                       140, 200)
+
+
+@pytest.fixture
+def payloads():
+    rnd = random.Random(0)
+    return [rawx_payload(3600 + 0.2 * k, rnd) for k in range(20)]
+
+
+def test_encode_matches_raw_packet(payloads):
+    minute = RawMinute()
+    for payload in payloads:
+        assert minute.add(payload)
+    assert bytes(minute.encode()) == raw_packet([RxmRawx(i) for i in payloads])
+
+
+def test_encode_into_reused_buffer(payloads):
+    minute = RawMinute()
+    buff = bytearray(b'\xff' * (minute.nbytes + 2**16))
+    for payload in payloads[:5]:
+        minute.add(payload)
+    minute.encode(buff)
+    minute.reset()
+    for payload in payloads[5:]:
+        minute.add(payload)
+    assert bytes(minute.encode(buff)) == raw_packet([RxmRawx(i) for i in payloads[5:]])
+
+
+def test_full_minute(payloads):
+    minute = RawMinute(max_epochs=3)
+    assert all(minute.add(i) for i in payloads[:3])
+    assert not minute.add(payloads[3])
+    assert bytes(minute.encode()) == raw_packet([RxmRawx(i) for i in payloads[:3]])
+
+
+def test_collector_matches_reader_loop():
+    rnd = random.Random(1)
+    frames = []
+    for k in range(5 * 150):
+        tow = 3600 + k / 5
+        frames.append((RxmRawx.id, rawx_payload(tow, rnd)))
+        if k % 5 == 0:
+            frames.append((NavHPPOSLLH.id, hpposllh_payload(int(tow * 1000), rnd)))
+
+    pool = BufferPool(1, 2**20)
+    collector = MinuteCollector(pool)
+    out = []
+    for frame in frames:
+        for kind, data, buff in collector.feed(*frame):
+            out.append((kind, bytes(data)))
+            if buff is not None:
+                pool.release(buff)
+    out += [(kind, bytes(data)) for kind, data, _ in collector.flush()]
+
+    # Minutes split by time of week like the reader loop, where a minute starts at (tow - leapS) % 60 == 0
+    raw = {}
+    pos = {}
+    for msg_id, payload in frames:
+        if msg_id == RxmRawx.id:
+            packet = RxmRawx(payload)
+            raw.setdefault((packet.rcvTow - LEAP) // 60, []).append(packet)
+        else:
+            packet = NavHPPOSLLH(payload)
+            pos.setdefault((packet.iTOW / 1000 - LEAP) // 60, []).append(packet)
+    assert [d for k, d in out if k == 'raw'] == [raw_packet(raw[i]) for i in sorted(raw)]
+    assert [d for k, d in out if k == 'pos'] == [pos_packet(pos[i], WEEK, LEAP) for i in sorted(pos)]
@@ -0,0 +1,80 @@
+import random
+import struct
+from ublox.messages import NavHPPOSLLH, RxmRawx
+from ublox.ublox_reader import MAX_PAYLOAD, UBXFramer, fletcher, split_frames
+
+
+def frame(msg_id, payload):
+    """ Bytes of a UBX packet. """
+    body = struct.pack('<HH', msg_id, len(payload)) + payload
+    return b'\xb5\x62' + body + bytes(fletcher(body))
+
+
+PACKETS = [(RxmRawx.id, bytes(range(40))), (NavHPPOSLLH.id, b'\x01' * 36), (0x0d01, b''), (RxmRawx.id, b'\xb5' * 3)]
+STREAM = b''.join(frame(*i) for i in PACKETS)
+
+
+def test_split_whole_buffer():
+    frames, pos = split_frames(STREAM)
+    assert [(msg_id, payload) for _, msg_id, payload in frames] == PACKETS
+    assert frames[1][0] == len(frame(*PACKETS[0]))
+    assert pos == len(STREAM)
+
+
+def test_frames_split_across_feeds():
+    rnd = random.Random(0)
+    for _ in range(20):
+        framer = UBXFramer()
+        out = []
+        i = 0
+        while i < len(STREAM):
+            n = rnd.randrange(1, 12)
+            out += framer.feed(STREAM[i:i + n])
+            i += n
+        assert out == PACKETS
+        assert len(framer) == 0
+
+
+def test_frame_split_in_header():
+    framer = UBXFramer()
+    assert framer.feed(STREAM[:5]) == []
+    assert len(framer) == 5
+    assert framer.feed(STREAM[5:]) == PACKETS
+
+
+def test_false_sync_in_payload():
+    # A payload that contains a sync and a plausible header is taken whole, it is not split at the false sync
+    inner = frame(NavHPPOSLLH.id, b'\x02' * 4)
+    packet = (RxmRawx.id, b'\x00' * 3 + inner + b'\x00' * 5)
+    assert UBXFramer().feed(frame(*packet)) == [packet]
+
+
+def test_bad_checksum_resyncs():
+    good = frame(*PACKETS[1])
+    bad = bytearray(frame(RxmRawx.id, b'\x00' * 3 + good + b'\x00'))
+    bad[-1] ^= 0xff
+    # Garbage, then a packet with a bad checksum whose payload holds a valid packet
+    data = b'\x00\xb5\x00' + bytes(bad) + frame(*PACKETS[0])
+    assert UBXFramer().feed(data) == [PACKETS[1], PACKETS[0]]
+
+
+def test_trailing_lone_sync_byte():
+    data = STREAM + b'\xb5'
+    frames, pos = split_frames(data)
+    assert len(frames) == len(PACKETS)
+    assert pos == len(STREAM)  # The lone 0xb5 is kept, it may start the next packet
+
+    framer = UBXFramer()
+    assert framer.feed(data) == PACKETS
+    assert len(framer) == 1
+    packet = frame(*PACKETS[0])
+    assert framer.feed(packet[1:]) == [PACKETS[0]]
+    assert split_frames(b'\x00\x01\x02')[1] == 3
+
+
+def test_length_over_max_payload():
+    # A false header with a length over MAX_PAYLOAD must not hold back the packets after it
+    false = b'\xb5\x62' + struct.pack('<HH', RxmRawx.id, MAX_PAYLOAD + 1)
+    assert UBXFramer().feed(false + frame(*PACKETS[1])) == [PACKETS[1]]
+    packet = (RxmRawx.id, bytes(MAX_PAYLOAD))
+    assert UBXFramer().feed(frame(*packet)) == [packet]
@@ -0,0 +1,101 @@
+import time
+import struct
+import pytest
+from ublox.messages import NavHPPOSLLH, RxmRawx
+from ublox.sources import ByteSource, FileSource, ReplaySource, open_source
+from ublox.ublox_reader import UBXFramer, fletcher
+
+
+def frame(msg_id, payload):
+    """ Bytes of a UBX packet. """
+    body = struct.pack('<HH', msg_id, len(payload)) + payload
+    return b'\xb5\x62' + body + bytes(fletcher(body))
+
+
+def rawx(tow, week=2100):
+    """ RXM-RAWX packet without measurements. """
+    return frame(RxmRawx.id, struct.pack('<dHbBBBH', tow, week, 18, 0, 1, 1, 0))
+
+
+class PieceSource(ByteSource):
+    """ Source that returns a list of pieces one read at a time, and has no data once they are used up. """
+    def __init__(self, pieces):
+        super().__init__()
+        self._pieces = list(pieces)
+        self.waits = []
+
+    def _read_available(self, max_bytes):
+        return self._pieces.pop(0) if self._pieces else b''
+
+    def _wait(self, timeout):
+        self.waits.append(timeout)
+        return bool(self._pieces)
+
+
+def replay(path, speed):
+    """ Read a replay to the end. Returns the list of (seconds since the start, msg_id) of the packets. """
+    src = ReplaySource(path, speed)
+    framer = UBXFramer()
+    start = time.monotonic()
+    out = []
+    try:
+        while True:
+            src.wait(1.)
+            for msg_id, _ in framer.feed(src.read_available()):
+                out.append((time.monotonic() - start, msg_id))
+    except EOFError:
+        pass
+    src.close()
+    return out
+
+
+def test_read_joins_pieces():
+    src = PieceSource([b'ab', b'c', b'defg'])
+    assert src.read(5) == b'abcde'
+    assert src.read_available() == b'fg'  # Bytes read ahead are returned first
+
+
+def test_read_timeout():
+    src = PieceSource([b'ab', b'cd'])
+    src.timeout = 0.5
+    assert src.read(6) == b'abcd'  # Fewer bytes once no more data comes within the timeout
+    assert src.waits[-1] == 0.5
+    assert src.read(1) == b''
+
+
+def test_file_source_eof(tmp_path):
+    path = tmp_path / 'capture.ubx'
+    path.write_bytes(rawx(0.) + rawx(1.))
+    with open_source(str(path)) as src:
+        assert isinstance(src, FileSource)
+        assert src.read(len(rawx(0.))) == rawx(0.)
+        src.read_available()
+        with pytest.raises(EOFError):
+            src.read_available()
+
+
+def test_replay_pacing(tmp_path):
+    path = tmp_path / 'capture.ubx'
+    path.write_bytes(rawx(3600.) + frame(NavHPPOSLLH.id, bytes(36)) + rawx(3601.) + rawx(3602.))
+    out = replay(path, 10)
+    assert [i[1] for i in out] == [RxmRawx.id, NavHPPOSLLH.id, RxmRawx.id, RxmRawx.id]
+    assert out[0][0] < 0.05
+    assert out[1][0] < 0.05  # Released with the RAWX packet before it
+    assert 0.09 <= out[2][0] < 0.15
+    assert 0.19 <= out[3][0] < 0.25
+
+
+def test_replay_week_rollover(tmp_path):
+    path = tmp_path / 'capture.ubx'
+    path.write_bytes(rawx(604799.) + rawx(0., 2101) + rawx(1., 2101))
+    out = replay(path, 10)
+    assert 0.09 <= out[1][0] < 0.15  # One second after the end of the week, not a week before it
+    assert 0.19 <= out[2][0] < 0.25
+
+
+def test_replay_as_fast_as_possible(tmp_path):
+    path = tmp_path / 'capture.ubx'
+    path.write_bytes(b''.join(rawx(3600. + 60 * k) for k in range(10)))
+    out = replay(path, 0)
+    assert len(out) == 10
+    assert out[-1][0] < 0.5
@@ -0,0 +1,113 @@
+import struct
+import numpy as np
+import pytest
+from ublox.messages import RxmRawx
+from ublox.tracking import ACQUIRED, HALF_CYCLE, LOST, SLIP, TrackingTable
+
+WEEK = 2100
+
+
+def epoch(tow, signals):
+    """ RxmRawx packet with a measurement per (gnssId, svId, sigId, locktime, cno, halfCyc) of signals. """
+    parts = [struct.pack('<dHbBBBH', tow, WEEK, 18, len(signals), 1, 1, 0)]
+    for gnss, sv, sig, lock, cno, half in signals:
+        parts.append(struct.pack('<ddfBBBBHBBBBBB', 2.2e7, 1.1e8, 100., gnss, sv, sig, 0, lock, cno, 3, 2, 4,
+                                 0x03 | half << 2, 0))
+    return RxmRawx(b''.join(parts))
+
+
+def kinds(events):
+    return [(e.kind, e.key) for e in events]
+
+
+def test_acquire():
+    table = TrackingTable()
+    events = table.update(epoch(100., [(0, 5, 0, 0, 40, 1), (2, 3, 0, 0, 35, 1)]))
+    assert kinds(events) == [(ACQUIRED, (0, 5, 0)), (ACQUIRED, (2, 3, 0))]
+    assert events[0].week == WEEK and events[0].rcvTow == 100.
+    assert len(table) == 2
+    assert (0, 5, 0) in table
+    assert (table.week, table.rcvTow) == (WEEK, 100.)
+    assert table.update(epoch(101., [(2, 3, 0, 1000, 36, 1), (0, 5, 0, 1000, 42, 1)])) == []
+    arc = table.arc((0, 5, 0))
+    assert (arc.startTow, arc.endTow, arc.epochs, arc.cnoMean, arc.cnoMin, arc.cnoMax, arc.maxLocktime) == \
+        (100., 101., 2, 41., 40, 42, 1000)
+
+
+def test_slip():
+    table = TrackingTable()
+    table.update(epoch(100., [(0, 5, 0, 0, 40, 1)]))
+    table.update(epoch(101., [(0, 5, 0, 1000, 40, 1)]))
+    events = table.update(epoch(102., [(0, 5, 0, 200, 30, 1)]))  # Lock time went back
+    assert kinds(events) == [(SLIP, (0, 5, 0))]
+    assert (events[0].arc.startTow, events[0].arc.endTow, events[0].arc.epochs) == (100., 101., 2)
+    assert table.slips((0, 5, 0)) == 1
+    arc = table.arc((0, 5, 0))
+    assert (arc.startTow, arc.epochs, arc.cnoMin) == (102., 1, 30)
+
+
+def test_half_cycle():
+    table = TrackingTable()
+    table.update(epoch(100., [(0, 5, 0, 0, 40, 0)]))
+    events = table.update(epoch(101., [(0, 5, 0, 1000, 40, 1)]))
+    assert kinds(events) == [(HALF_CYCLE, (0, 5, 0))]
+    assert events[0].arc is None
+    assert table.update(epoch(102., [(0, 5, 0, 2000, 40, 1)])) == []
+    assert table.slips((0, 5, 0)) == 0
+
+
+def test_lost():
+    table = TrackingTable()
+    table.update(epoch(100., [(0, 5, 0, 0, 40, 1), (0, 7, 0, 0, 30, 1)]))
+    events = table.update(epoch(101., [(0, 7, 0, 1000, 30, 1)]))
+    assert kinds(events) == [(LOST, (0, 5, 0))]
+    assert (events[0].arc.startTow, events[0].arc.endTow, events[0].arc.epochs) == (100., 100., 1)
+    assert (0, 5, 0) not in table
+    with pytest.raises(KeyError):
+        table.arc((0, 5, 0))
+    # Seen again later, it is a new arc
+    assert kinds(table.update(epoch(102., [(0, 5, 0, 0, 40, 1), (0, 7, 0, 2000, 30, 1)]))) == \
+        [(ACQUIRED, (0, 5, 0))]
+
+
+def test_duplicate_measurement_ignored():
+    table = TrackingTable()
+    table.update(epoch(100., [(0, 5, 0, 1000, 40, 1)]))
+    assert table.update(epoch(101., [(0, 5, 0, 2000, 40, 1), (0, 5, 0, 0, 40, 1)])) == []
+    assert table.arc((0, 5, 0)).maxLocktime == 2000
+
+
+def test_slot_reuse():
+    table = TrackingTable(capacity=2)
+    table.update(epoch(100., [(0, 1, 0, 0, 40, 1), (0, 2, 0, 0, 40, 1)]))
+    table.update(epoch(101., [(0, 2, 0, 1000, 40, 1)]))  # 1 is lost and frees its slot
+    table.update(epoch(102., [(0, 2, 0, 2000, 40, 1), (0, 3, 0, 0, 40, 1)]))
+    assert table.capacity == 2
+    assert len(table) == 2
+    assert table.arc((0, 3, 0)).startTow == 102.
+
+
+def test_growth_past_capacity():
+    table = TrackingTable(capacity=2)
+    table.update(epoch(100., [(0, 1, 0, 0, 40, 1), (0, 2, 0, 0, 41, 1)]))
+    signals = [(0, 1, 0, 1000, 40, 1), (0, 2, 0, 1000, 41, 1), (2, 4, 0, 0, 42, 1), (1, 131, 0, 0, 43, 1),
+               (0, 1, 3, 0, 44, 1)]
+    events = table.update(epoch(101., signals))
+    assert kinds(events) == [(ACQUIRED, (2, 4, 0)), (ACQUIRED, (1, 131, 0)), (ACQUIRED, (0, 1, 3))]
+    assert table.capacity == 8
+    assert len(table) == 5
+    # Signals tracked before the table grew keep their state
+    assert table.arc((0, 1, 0)).epochs == 2
+    assert table.arc((0, 2, 0)).cnoMean == 41.
+
+
+def test_snapshot_order():
+    table = TrackingTable()
+    table.update(epoch(100., [(2, 4, 0, 0, 42, 1), (0, 9, 0, 0, 40, 0), (0, 1, 3, 0, 44, 1), (0, 1, 0, 0, 45, 1)]))
+    snapshot = table.snapshot()
+    np.testing.assert_array_equal(snapshot['gnssId'], [0, 0, 0, 2])
+    np.testing.assert_array_equal(snapshot['svId'], [1, 1, 9, 4])
+    np.testing.assert_array_equal(snapshot['sigId'], [0, 3, 0, 0])
+    np.testing.assert_array_equal(snapshot['cno'], [45, 44, 40, 42])
+    np.testing.assert_array_equal(snapshot['halfCyc'], [True, True, False, True])
+    np.testing.assert_array_equal(snapshot['arcEpochs'], 1)
@@ -0,0 +1,106 @@
+import time
+import struct
+import pytest
+from ublox import uploader
+from ublox.api import pos_record_offsets, raw_record_offsets
+from ublox.uploader import AdaptiveUploader
+
+
+def raw_minute(nums, tow=3600.):
+    """ Data like raw_packet makes, with epochs of nums measurements. """
+    return b''.join(struct.pack('<dHbB', tow + k, 2100, 18, n) + bytes(22 * n) for k, n in enumerate(nums))
+
+
+def wait_for(condition, timeout=5.):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, 'Timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    """ Stub send that records the data of each POST and answers from the list ok, True once it is empty. """
+    sent = []
+
+    def send(url, key, data, label, timeout=None):
+        sent.append(bytes(data))
+        return posts.ok.pop(0) if posts.ok else True
+
+    posts = type('Posts', (), {'sent': sent, 'ok': []})
+    monkeypatch.setattr(uploader, 'send', send)
+    return posts
+
+
+def test_batch_pieces_cut_at_records():
+    up = AdaptiveUploader('url', 'key', {}, raw_record_offsets)
+    first, second = raw_minute([2, 3, 1]), raw_minute([4])
+    up.submit(1., first)
+    up.submit(2., second)
+    offsets = raw_record_offsets(first)
+
+    up._batch = offsets[2] + 10  # Room for two epochs and part of the third
+    assert [(entry.t, end) for entry, end in up._batch_pieces()] == [(1., offsets[2])]
+
+    up._batch = 1  # Less than an epoch, still sends one
+    assert [(entry.t, end) for entry, end in up._batch_pieces()] == [(1., offsets[1])]
+
+    up._batch = len(first) + 10  # The whole first minute, nothing of the second fits
+    assert [(entry.t, end) for entry, end in up._batch_pieces()] == [(1., len(first))]
+
+    up._queue[0].pos = offsets[2]  # Last epoch of the first minute left, then the second minute
+    up._batch = len(first) - offsets[2] + len(second)
+    assert [(entry.t, end) for entry, end in up._batch_pieces()] == [(1., len(first)), (2., len(second))]
+
+
+def test_one_position_per_post(posts):
+    up = AdaptiveUploader('url', 'key', {}, pos_record_offsets, min_bytes=30, max_bytes=30).start()
+    data = [bytes([k]) * 30 for k in range(4)]
+    up.submit(1., data[0] + data[1])
+    up.submit(2., data[2])
+    up.submit(3., data[3])
+    wait_for(lambda: len(posts.sent) == 4)
+    up.stop()
+    assert posts.sent == data
+
+
+def test_inflight_limit_spools():
+    cache = {}
+    released = []
+    up = AdaptiveUploader('url', 'key', cache, raw_record_offsets, max_inflight=150)
+    first, second = raw_minute([3]), raw_minute([5])  # 78 and 122 bytes
+    up.submit(1., first, lambda: released.append(1))
+    up.submit(2., second, lambda: released.append(2))
+    assert released == [2]  # Spooled data is given back at once
+    assert cache == {b'2.0': second}
+    assert up.metrics['bytes_queued'] == len(first)
+    assert up.metrics['bytes_spooled'] == len(second)
+
+
+def test_spool_drains_in_order(posts):
+    cache = {b'%d' % k: raw_minute([k + 1], 3600. + 60 * k) for k in range(5)}
+    cache[b'2'] = b'\x01\x02'  # Corrupt entry, it is dropped instead of stopping the upload thread
+    expected = [cache[b'%d' % k] for k in (0, 1, 3, 4)]
+    up = AdaptiveUploader('url', 'key', cache, raw_record_offsets, start_bytes=1 << 20).start()
+    wait_for(lambda: not cache)
+    up.stop()
+    assert posts.sent == expected
+
+
+def test_failed_post_retried_and_stop_ends_backoff(posts):
+    cache = {}
+    posts.ok = [False]
+    up = AdaptiveUploader('url', 'key', cache, raw_record_offsets).start()
+    data = raw_minute([2, 2])
+    up.submit(1., data)
+    wait_for(lambda: len(posts.sent) == 2)  # Retried after a second
+    assert posts.sent == [data, data]
+    assert up.metrics['failures'] == 1
+
+    posts.ok = [False]
+    up.submit(2., data)
+    wait_for(lambda: len(posts.sent) == 3)
+    start = time.monotonic()
+    up.stop()  # Ends the backoff wait instead of sleeping through it
+    assert time.monotonic() - start < 0.5
+    assert cache == {b'2.0': data}
@@ -1,9 +1,14 @@
-from ._main import main
 import logging
-logging.basicConfig(filename='/home/ccaruser/gps.log', level=logging.INFO)
+from ._main import main as _main
 
 
-try:
+def main():
+    """ Run the GPS reader and log the exception that stops it. """
+    try:
+        _main()
+    except Exception as e:
+        logging.exception(e)
+
+
+if __name__ == '__main__':
     main()
-except Exception as e:
-    logging.exception(e)
\ No newline at end of file
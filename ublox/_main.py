@@ -1,21 +1,21 @@
-import serial
 import datetime as dt
 import argparse
 import sys
 import os
 import socket
-import diskcache as dc
 import logging
 from configparser import ConfigParser
-from threading import Thread
+from threading import Lock, Thread
 from .ublox_reader import UBXReader
 from .ublox_writer import UBXWriter
 from .messages import NavTimeUTC, NavHPPOSLLH, AckAck, AckNak, CfgValgetRec, RxmRawx, InfDebug, InfError, InfNotice, \
                       InfTest, InfWarning, CfgValsetSend
-from .api import call_send, pos_packet, raw_packet, save_to_dc, send_old
-from .led import LED
-
-logging.basicConfig(filename='/home/ccaruser/gps.log', level=logging.INFO)
+from .api import call_send, pos_packet, raw_packet, save_to_dc, send_old, raw_record_offsets, pos_record_offsets, \
+                 _POS_SIZE
+from .uploader import AdaptiveUploader
+from .fanout import RingPublisher
+from .pipeline import DecodePipeline, EncodedRawx
+from .sources import SerialSource, open_source
 
 
 def read_key(fname):
@@ -30,7 +30,15 @@ def read_key(fname):
 
 
 def main():
-    url = 'https://cods.colorado.edu/api/gpslidar/'
+    # Serial, GPIO, disk cache and numpy are only needed by the reader itself, so they are not imported with the module
+    import diskcache as dc
+    from .led import LED, NullLED
+    from .gpstime import second_of_minute, unix_now
+    from .archive import ArchiveWriter
+    from .minute import BufferPool, MinuteCollector, rss_bytes
+    from .timers import Heartbeat, TimerWheel
+    from .tracking import ACQUIRED, HALF_CYCLE, LOST, SLIP, TrackingTable
+
     msg_dict = {NavTimeUTC.id: NavTimeUTC,
                 NavHPPOSLLH.id: NavHPPOSLLH,
                 AckAck.id: AckAck,
@@ -53,9 +61,44 @@ def main():
                         help='Location of configuration file to use. Default is "default.ini"')
     parser.add_argument('-l', '--location', type=str, default=def_loc,
                         help='GPS location. Default is first four letters of hostname (' + def_loc + ')')
-    parser.add_argument('--led', type=int, default=21, help='LED pin. Default is 21.')
+    parser.add_argument('--led', type=int, default=21, help='LED pin, negative for no LED. Default is 21.')
+    parser.add_argument('-u', '--url', type=str, default='https://cods.colorado.edu/api/gpslidar/',
+                        help='Base URL of the ingest API. Default is "https://cods.colorado.edu/api/gpslidar/"')
+    parser.add_argument('-k', '--keys', type=str, default='/home/ccaruser/.keys',
+                        help='Directory of private keys. Default is "/home/ccaruser/.keys"')
+    parser.add_argument('-s', '--source', type=str, default=None,
+                        help='Byte source, e.g. "tcp://host:port" or "replay:///path/capture.ubx?speed=10". Default '
+                             'is the serial port of the communication type.')
+    parser.add_argument('--cache-dir', type=str, default='/var/tmp',
+                        help='Directory of the caches of data not sent yet. Default is "/var/tmp"')
+    parser.add_argument('-a', '--archive', type=str, default=None,
+                        help='Directory to archive decoded data to. Default is no local archive.')
+    parser.add_argument('--tracking', action='store_true',
+                        help='Track signals across epochs and log cycle slips and the arcs of lost signals. Decodes '
+                             'RXM-RAWX in the read loop, also with --workers or --memory-bounded.')
+    parser.add_argument('--fanout', type=str, default=None,
+                        help='Name of a shared memory ring to publish received packets to. Default is no ring.')
+    parser.add_argument('--adaptive-upload', action='store_true',
+                        help='Upload in batches sized to the measured link instead of one minute per request.')
+    parser.add_argument('--memory-bounded', action='store_true',
+                        help='Keep minutes in reused arrays and buffers instead of packet objects, and save minutes to '
+                             'the cache instead of memory above --rss-limit. Implies --adaptive-upload.')
+    parser.add_argument('--rss-limit', type=float, default=256,
+                        help='Resident memory in MB above which --memory-bounded saves new minutes to the cache. '
+                             'Default is 256')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Decode and encode packets in this many worker processes, 0 for the same code in this '
+                             'process. Default is to decode in the read loop. Not used with --memory-bounded.')
+    parser.add_argument('--stall-timeout', type=float, default=10,
+                        help='Seconds without packets after which the reader is reported as stalled. Default is 10')
+    parser.add_argument('--metrics-interval', type=float, default=60,
+                        help='Seconds between logging reader and upload metrics. Default is 60')
+    parser.add_argument('--log', type=str, default='/home/ccaruser/gps.log',
+                        help='Log file. Default is "/home/ccaruser/gps.log"')
     args = parser.parse_args()
 
+    logging.basicConfig(filename=args.log, level=logging.INFO)
+
     if args.comm == "USB":
         port = '/dev/serial/by-id/usb-u-blox_AG_-_www.u-blox.com_u-blox_GNSS_receiver-if00'  # Serial port  TODO: UART
     elif args.comm == "UART":
@@ -64,12 +107,7 @@ def main():
         logging.critical("Bad communication type: " + args.comm)
         sys.exit(0)
 
-    dev = serial.Serial(port,
-                        timeout=5,
-                        baudrate=38400,
-                        parity=serial.PARITY_NONE,
-                        stopbits=serial.STOPBITS_ONE,
-                        bytesize=serial.EIGHTBITS)  # Open serial port
+    dev = open_source(args.source or 'serial:' + port)  # Open serial port or other source
 
     # Configure
     config = ConfigParser(inline_comment_prefixes=('#', ';'))
@@ -82,14 +120,20 @@ def main():
     wrtr.write_packet(packet.payload(), packet.id)  # Write ublox packets
 
     try:
-        dev.baudrate = config[args.comm]['CFG-UART1-BAUDRATE']  # Set baud rate to desired rate in configuration file
+        if isinstance(dev, SerialSource):
+            dev.baudrate = config[args.comm]['CFG-UART1-BAUDRATE']  # Set baud rate to rate in configuration file
     except KeyError:  # If there is no baud rate in configuration file
         pass
 
     # Read packets
     loc = args.location
-    key = read_key('/home/ccaruser/.keys/' + loc + '.key')  # Private key for sending
-    led = LED(args.led)  # LED class initialization
+    key = read_key(os.path.join(args.keys, loc + '.key'))  # Private key for sending
+    url = args.url
+    try:
+        led = LED(args.led) if args.led >= 0 else NullLED()  # LED class initialization
+    except (ImportError, RuntimeError):  # No GPIO, or not on a Raspberry Pi
+        logging.warning('GPIO not available, running without the LED')
+        led = NullLED()
     led.set_high()  # Turn on LED
 
     next_raw, next_pos = [], []
@@ -97,28 +141,188 @@ def main():
     leapS = None
     week = None
 
-    cache_raw = dc.Cache('/var/tmp/unsent_gpsraw')
-    cache_pos = dc.Cache('/var/tmp/unsent_gpspos')
+    cache_raw = dc.Cache(os.path.join(args.cache_dir, 'unsent_gpsraw'))
+    cache_pos = dc.Cache(os.path.join(args.cache_dir, 'unsent_gpspos'))
+
+    archive = ArchiveWriter(args.archive) if args.archive else None  # Local archive of decoded data
+    ring = RingPublisher(args.fanout) if args.fanout else None  # Packets for other local processes
+    tracking = TrackingTable() if args.tracking else None  # State of each tracked signal across epochs
+    events = dict.fromkeys((ACQUIRED, SLIP, HALF_CYCLE, LOST), 0)  # Tracking events since the last metrics log
+
+    def track(packet):
+        """ Update the tracking table with an epoch and log the cycle slips and the arcs of lost signals. """
+        if not isinstance(packet, RxmRawx):
+            return
+        for event in tracking.update(packet):
+            events[event.kind] += 1
+            if event.arc:
+                arc = event.arc
+                logging.info(f'{event.kind.capitalize()} {event.key} at {event.week}:{event.rcvTow:.1f}, arc of '
+                             f'{arc.epochs} epochs from {arc.startTow:.1f}, C/N0 {arc.cnoMean:.1f} dBHz '
+                             f'({arc.cnoMin}-{arc.cnoMax})')
+
+    urls = {'raw': url + 'rawgps/' + loc, 'pos': url + 'posgps/' + loc}
+    caches = {'raw': cache_raw, 'pos': cache_pos}
+    senders = {}  # Upload thread of each kind of data
+    senders_lock = Lock()
+
+    def drain():
+        """ Send old data saved to the caches, unless an upload of the same kind is already running. """
+        with senders_lock:
+            for kind in senders:
+                if not senders[kind].is_alive() and len(caches[kind]):
+                    senders[kind] = Thread(target=send_old, args=(caches[kind], urls[kind], key))
+                    senders[kind].start()
 
-    # Send old data
-    t2 = Thread(target=send_old, args=(cache_raw, url + 'rawgps/' + loc, key))
-    t2.start()
-    t3 = Thread(target=send_old, args=(cache_pos, url + 'posgps/' + loc, key))
-    t3.start()
+    def upload(kind, data):
+        """ Send a minute of data in a new thread, or save it to the cache if the last upload is still running. """
+        with senders_lock:
+            if not senders[kind].is_alive():
+                senders[kind] = Thread(target=call_send, args=(urls[kind], key, data, unix_now(), caches[kind]))
+                senders[kind].start()
+            else:
+                save_to_dc(caches[kind], unix_now(), data)
+
+    if args.adaptive_upload or args.memory_bounded:  # Uploaders send old data themselves once they catch up
+        up_raw = AdaptiveUploader(urls['raw'], key, cache_raw, raw_record_offsets).start()
+        up_pos = AdaptiveUploader(urls['pos'], key, cache_pos, pos_record_offsets, min_bytes=_POS_SIZE,
+                                  max_bytes=_POS_SIZE).start()  # One position per POST
+    else:
+        up_raw, up_pos = None, None
+        # Send old data
+        senders['raw'] = senders['pos'] = Thread()
+        drain()
 
     logging.info('Starting ' + loc + ' GPS at: ' + str(dt.datetime.utcnow()))
 
-    try:
+    rdr = UBXReader(dev, msg_dict)  # Initialize reader
+
+    if args.workers is not None and not args.memory_bounded:
+        pipeline = DecodePipeline(msg_dict, args.workers)  # Workers return RXM-RAWX epochs already encoded
+    else:
+        pipeline = None
+
+    def read_packets():
+        """ Generator of decoded packets in the order they were read. """
         while True:
-            led_timer = dt.datetime.utcnow()
+            try:
+                msg_id, payload = rdr.read_frame()  # Read packet
+            except EOFError:  # Packets still in the pipeline were read before the end
+                if pipeline:
+                    yield from pipeline.flush()
+                raise
+            heartbeat.beat()
+            if ring:
+                ring.publish(msg_id, payload)
+            if not pipeline:
+                packet = rdr.decode(msg_id, payload)
+                if tracking is not None:
+                    track(packet)
+                yield packet
+                continue
+            if archive and msg_id == RxmRawx.id:
+                archive.append_rawx_payload(payload)  # Epochs come back encoded, so they are archived from here
+            if tracking is not None and msg_id == RxmRawx.id:
+                track(rdr.decode(msg_id, payload))
+            yield from pipeline.feed(msg_id, payload)
+
+    if args.memory_bounded:
+        pool = BufferPool(4, 1200 * 12 + 76800 * 22)  # Room for minutes of up to 20 Hz with 64 signals
+        collector = MinuteCollector(pool)
+        rss_limit = args.rss_limit * 2**20
+    else:
+        collector = None
+
+    heartbeat = Heartbeat(args.stall_timeout)
+    packets = 0  # Packet count at the last metrics log
+
+    def blink():
+        """ Switch the LED every second while packets are coming in, and keep it on while the reader is stalled. """
+        if heartbeat.check():
+            led.switch()
+        else:
+            led.set_high()
+
+    def log_metrics():
+        """ Log the packet rate, upload metrics and memory use. """
+        nonlocal packets
+        count = heartbeat.count
+        logging.info(f'Reader: {(count - packets) / args.metrics_interval:.1f} packets/s, '
+                     f'{len(cache_raw)} raw and {len(cache_pos)} position minutes in the cache')
+        packets = count
+        for uploader in (up_raw, up_pos):
+            if uploader:
+                metrics = uploader.metrics
+                del metrics['decisions']
+                logging.info('Upload: ' + str(metrics))
+        if collector:
+            logging.info(f'Memory: {rss_bytes() / 2**20:.1f} MB resident, {pool.available} free buffers, '
+                         f'pool empty {collector.pool_empty} times')
+        if tracking is not None:
+            logging.info(f'Tracking: {len(tracking)} signals, ' + ', '.join(f'{events[i]} {i}' for i in events))
+            for i in events:
+                events[i] = 0
+
+    timers = TimerWheel()
+    timers.every(1, blink)  # LED heartbeat and reader health check
+    timers.every(args.metrics_interval, log_metrics)
+    if not up_raw:
+        timers.every(300, drain)  # Uploads in the loop only drain the cache after a new minute is sent
+    timers.start()
+
+    def dispatch(kind, data, buff):
+        """ Hand a minute closed by the collector to its uploader, or to the cache under memory pressure. """
+        uploader, cache = (up_raw, cache_raw) if kind == 'raw' else (up_pos, cache_pos)
+        done = (lambda: pool.release(buff)) if buff is not None else None
+        if (kind == 'raw' and buff is None) or rss_bytes() > rss_limit:
+            save_to_dc(cache, unix_now(), bytes(data))
+            if done:
+                done()
+            logging.warning('Memory limit reached. Data saved to cache. ')
+        else:
+            uploader.submit(unix_now(), data, done)
+
+    try:
+        while collector:  # Memory bounded loop, minutes are closed by the collector
+            closed = False
+            while not closed:
+                msg_id, payload = rdr.read_frame()  # Read packet
+                heartbeat.beat()
+                if ring:
+                    ring.publish(msg_id, payload)
+                if tracking is not None and msg_id == RxmRawx.id:
+                    track(rdr.decode(msg_id, payload))
+                if archive:
+                    if msg_id == RxmRawx.id:
+                        archive.append_rawx_payload(payload)
+                    else:
+                        packet = rdr.decode(msg_id, payload)
+                        if isinstance(packet, NavHPPOSLLH):
+                            archive.append_pos(packet)
+                        elif isinstance(packet, NavTimeUTC):
+                            archive.append_time(packet)
+                for minute in collector.feed(msg_id, payload):
+                    dispatch(*minute)
+                    closed = True
+            if archive:
+                archive.flush()  # Write the minute of data to the archive
+
+        stream = read_packets()
+        ended = False
+        while not ended:
             raw, hp_pos = next_raw, next_pos  # Initialization of vectors
             next_raw, next_pos = [], []
             prev_raw, prev_pos = 0, 0
             while True:
-                rdr = UBXReader(dev, msg_dict)  # Initialize reader
-                packet = rdr.read_packet()  # Read packet
-                if isinstance(packet, RxmRawx):  # If raw gps position packet
-                    mod_raw = (packet.rcvTow - packet.leapS) % 60
+                try:
+                    packet = next(stream)
+                except EOFError:  # Send the minute cut short by the end of the source as well
+                    ended = True
+                    break
+                if isinstance(packet, (RxmRawx, EncodedRawx)):  # If raw gps position packet
+                    mod_raw = second_of_minute(packet.rcvTow, packet.leapS)
+                    if archive and isinstance(packet, RxmRawx):
+                        archive.append_rawx(packet)
                     if mod_raw >= prev_raw:
                         raw.append(packet)
                         week = packet.week
@@ -128,7 +332,9 @@ def main():
                         next_raw.append(packet)
                         break
                 elif isinstance(packet, NavHPPOSLLH) and leapS:  # If high precision gps position packet
-                    mod_pos = ((packet.iTOW / 1000) - leapS) % 60
+                    if archive:
+                        archive.append_pos(packet)
+                    mod_pos = second_of_minute(packet.iTOW / 1000, leapS)
                     if mod_pos >= prev_pos:
                         hp_pos.append(packet)
                         prev_pos = mod_pos
@@ -136,6 +342,8 @@ def main():
                         next_pos.append(packet)
                         break
                 elif isinstance(packet, NavTimeUTC):  # If time packet
+                    if archive:
+                        archive.append_time(packet)
                     #if packet.nano < 0:
                     #    time = dt.datetime(packet.year, packet.month, packet.day, packet.hour, packet.min,
                     #                       packet.sec, -packet.nano // 10**3)
@@ -148,31 +356,41 @@ def main():
                     pass
                 else:
                     pass
-                if (dt.datetime.utcnow() - led_timer).total_seconds() >= 1:  # Switch led every second
-                    led.switch()
-                    led_timer = dt.datetime.utcnow()
+
+            if archive:
+                archive.flush()  # Write the minute of data to the archive
+
+            if up_raw:
+                if raw:
+                    up_raw.submit(unix_now(), raw_packet(raw))
+                if hp_pos and week and leapS:
+                    up_pos.submit(unix_now(), pos_packet(hp_pos, week, leapS))
+                continue
 
             # Get packets to send and start threads to send packets through api
             if raw:
-                p_raw = raw_packet(raw)
-                if not t2.isAlive():
-                    t2 = Thread(target=call_send, args=(url + 'rawgps/' + loc, key, p_raw,
-                                                        (dt.datetime.utcnow()-dt.datetime(1970, 1, 1)).total_seconds(),
-                                                        cache_raw))
-                    t2.start()
-                else:
-                    save_to_dc(cache_raw, (dt.datetime.utcnow()-dt.datetime(1970, 1, 1)).total_seconds(), p_raw)
-
-            if hp_pos and week and leapS and not t3.is_alive():
-                p_pos = pos_packet(hp_pos, week, leapS)
-                if not t3.isAlive():
-                    t3 = Thread(target=call_send, args=(url + 'posgps/' + loc, key, p_pos,
-                                                        (dt.datetime.utcnow()-dt.datetime(1970, 1, 1)).total_seconds(),
-                                                        cache_pos))
-                    t3.start()
-                else:
-                    save_to_dc(cache_pos, (dt.datetime.utcnow()-dt.datetime(1970, 1, 1)).total_seconds(), p_pos)
+                upload('raw', raw_packet(raw))
+
+            if hp_pos and week and leapS:
+                upload('pos', pos_packet(hp_pos, week, leapS))
+        raise EOFError  # The last minute is sent, end like the memory bounded loop
 
+    except EOFError:  # End of a file or replay source
+        logging.info('End of ' + loc + ' GPS source at: ' + str(dt.datetime.utcnow()))
     finally:
-        # At the end turn LED off
+        # At the end stop the timers and turn LED off
+        timers.stop()
         led.set_low()
+        dev.close()
+        if collector:
+            for minute in collector.flush():  # Minutes cut short by the end of the source
+                dispatch(*minute)
+        if archive:
+            archive.close()
+        if ring:
+            ring.close()
+        if pipeline:
+            pipeline.close()
+        if up_raw:
+            up_raw.stop()  # Waits for a POST in progress, so nothing is both sent and saved
+            up_pos.stop()
@@ -1,10 +1,6 @@
-import requests
-import jwt
 import datetime as dt
 import struct
-import numpy as np
 import logging
-logging.basicConfig(filename='/home/ccaruser/gps.log', level=logging.INFO)
 
 
 def save_to_dc(cache, t, data):
@@ -31,13 +27,14 @@ def call_send(url, key, data, t, cache):
             logging.warning('No connection made. Data saved to cache. ')
 
 
-def send(url, key, data, s):
+def send(url, key, data, s, timeout=None):
     """ Function for sending packet.
         This returns true if it receives a 201 code and false if it receives any other code. """
+    import requests
     headers = {"Content-Type": "application/octet-stream",
                "Bearer": sign(key)}
     try:
-        upload = requests.post(url, data=data, headers=headers)
+        upload = requests.post(url, data=data, headers=headers, timeout=timeout)
     except:
         return False
     if upload.status_code != 201:
@@ -49,15 +46,21 @@ def send(url, key, data, s):
 
 def sign(key):
     """ This function signs the data with the private key of the given location. """
-    return jwt.encode({'t': str((dt.datetime.utcnow()-dt.datetime(1970, 1, 1)).total_seconds())}, key,
-                      algorithm='RS256')
+    import jwt
+    from .gpstime import unix_now
+    return jwt.encode({'t': str(unix_now())}, key, algorithm='RS256')
 
 
 def raw_packet(messages):
-    """ This function creates a packet from the raw data to be sent to the web server. """
-    packet = b''
+    """ This function creates a packet from the raw data to be sent to the web server. Epochs that were already
+        encoded by a decode worker (ublox.pipeline.EncodedRawx) are copied as they are. """
+    parts = []
     for i in messages:  # For each data point in minute of data
-        packet = packet + struct.pack('<dHbB', i.rcvTow, i.week, i.leapS, i.numMeas)  # Pack single data point values
+        encoded = getattr(i, 'encoded', None)
+        if encoded is not None:
+            parts.append(encoded)
+            continue
+        parts.append(struct.pack('<dHbB', i.rcvTow, i.week, i.leapS, i.numMeas))  # Pack single data point values
         for j in i.satellites:  # For each satellite
             for k in j:
                 cno = min(max(int(k.cno/6), 1), 9)  # Turn SNR into integer from 1 to 9
@@ -69,15 +72,94 @@ def raw_packet(messages):
                 #       Next three bits:                    signal to noise ratio transformed to integer between 1 and 9
                 other = ((k.gnssId & 0x07) << 12) | ((k.svId & 0x3f) << 6) | ((k.sigId & 0x07) << 3) | (cno & 0x07)
                 # Pack all data for each satellite
-                packet = packet + struct.pack('<ddfH', k.prMeas, k.cpMeas, k.doMeas, other)
-    return packet
+                parts.append(struct.pack('<ddfH', k.prMeas, k.cpMeas, k.doMeas, other))
+    return b''.join(parts)  # Joined once, adding to a bytes object copies the whole packet every time
 
 
 def pos_packet(messages, week, leapS):
     """ This functon creates a packet from the high precision position data to be sent to the web server. It only sends
         one averaged packet per minute. """
+    import numpy as np
     itow = int(np.mean([i.iTOW for i in messages]) - leapS*1000)  # GPS time of week average
     lon = np.mean([i.lon for i in messages])  # longitude average
     lat = np.mean([i.lat for i in messages])  # latitude average
     height = np.mean([i.height for i in messages])  # Height above ellipsoid average
     return struct.pack('<IHddd', itow, week, lon, lat, height)  # Return packet
+
+
+_RAW_HEADER = struct.Struct('<dHbB')  # Header of each epoch of a raw packet
+_RAW_SIZE = struct.calcsize('<ddfH')  # Size of each measurement of a raw packet
+_POS_SIZE = struct.calcsize('<IHddd')  # Size of a position packet
+
+
+def raw_record_offsets(data):
+    """ This function returns the offset of each epoch in a packet made by raw_packet. """
+    offsets = []
+    pos = 0
+    while pos < len(data):
+        offsets.append(pos)
+        pos += _RAW_HEADER.size + _RAW_SIZE * _RAW_HEADER.unpack_from(data, pos)[3]
+    return offsets
+
+
+def pos_record_offsets(data):
+    """ This function returns the offset of each minute in concatenated packets made by pos_packet. """
+    return list(range(0, len(data), _POS_SIZE))
+
+
+def _raw_epochs(data):
+    """ This function returns the offset and number of measurements of each epoch in a packet made by raw_packet. """
+    offsets, nums = [], []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        if pos + _RAW_HEADER.size > end:
+            raise ValueError('Raw packet ends inside an epoch header')
+        num = _RAW_HEADER.unpack_from(data, pos)[3]
+        offsets.append(pos)
+        nums.append(num)
+        pos += _RAW_HEADER.size + _RAW_SIZE * num
+    if pos != end:
+        raise ValueError('Raw packet ends inside an epoch')
+    return offsets, nums
+
+
+def decode_raw_packet(data):
+    """ This function decodes a packet made by raw_packet into a dictionary of numpy arrays. Epoch values are indexed
+        by epoch and measurement values by measurement, with the epoch of each measurement in 'epoch'. """
+    import numpy as np
+    offsets, nums = _raw_epochs(data)
+    buff = np.frombuffer(data, dtype=np.uint8)
+    offsets = np.array(offsets, dtype=np.int64)
+    nums = np.array(nums, dtype=np.int64)
+
+    # Measurements of an epoch follow its header, so removing the headers leaves the measurements back to back
+    header_bytes = (offsets[:, None] + np.arange(_RAW_HEADER.size)).ravel()
+    headers = buff[header_bytes].view(np.dtype([('rcvTow', '<f8'), ('week', '<u2'), ('leapS', 'i1'),
+                                                ('numMeas', 'u1')]))
+    mask = np.ones(len(buff), dtype=bool)
+    mask[header_bytes] = False
+    meas = buff[mask].view(np.dtype([('prMeas', '<f8'), ('cpMeas', '<f8'), ('doMeas', '<f4'), ('other', '<u2')]))
+    other = meas['other']
+    return {'rcvTow': headers['rcvTow'],
+            'week': headers['week'],
+            'leapS': headers['leapS'],
+            'numMeas': headers['numMeas'],
+            'epoch': np.repeat(np.arange(len(nums)), nums),
+            'prMeas': meas['prMeas'],
+            'cpMeas': meas['cpMeas'],
+            'doMeas': meas['doMeas'],
+            'gnssId': ((other >> 12) & 0x07).astype(np.uint8),
+            'svId': ((other >> 6) & 0x3f).astype(np.uint8),
+            'sigId': ((other >> 3) & 0x07).astype(np.uint8),
+            'cno': (other & 0x07).astype(np.uint8)}
+
+
+def decode_pos_packet(data):
+    """ This function decodes one or more packets made by pos_packet into a dictionary of numpy arrays. """
+    import numpy as np
+    if len(data) % _POS_SIZE:
+        raise ValueError('Position packet length is not a multiple of ' + str(_POS_SIZE))
+    pos = np.frombuffer(data, dtype=np.dtype([('iTOW', '<u4'), ('week', '<u2'), ('lon', '<f8'), ('lat', '<f8'),
+                                              ('height', '<f8')]))
+    return {i: pos[i] for i in pos.dtype.names}
@@ -0,0 +1,271 @@
+import os
+import json
+import struct
+import numpy as np
+from .messages import RAWX_DTYPE
+from .gpstime import GPS_EPOCH_UNIX, SECONDS_IN_WEEK, gps_seconds, leap_seconds_unix, utc_to_unix
+
+
+# Columns of each archived stream. Every stream starts with t, seconds since the GPS epoch, which is what readers
+# slice by.
+STREAMS = {
+    'rawx': [('t', '<f8'), ('week', '<u2'), ('rcvTow', '<f8'), ('leapS', 'i1'), ('gnssId', 'u1'), ('svId', 'u1'),
+             ('sigId', 'u1'), ('freqId', 'u1'), ('prMeas', '<f8'), ('cpMeas', '<f8'), ('doMeas', '<f4'),
+             ('cno', 'u1'), ('locktime', '<u2'), ('prStdev', '<f4'), ('cpStdev', '<f4'), ('doStdev', '<f4'),
+             ('trkStat', 'u1')],
+    'hpposllh': [('t', '<f8'), ('iTOW', '<u4'), ('lon', '<f8'), ('lat', '<f8'), ('height', '<f8'), ('hMSL', '<f8'),
+                 ('hAcc', '<f4'), ('vAcc', '<f4')],
+    'timeutc': [('t', '<f8'), ('iTOW', '<u4'), ('tAcc', '<u4'), ('nano', '<i4'), ('year', '<u2'), ('month', 'u1'),
+                ('day', 'u1'), ('hour', 'u1'), ('min', 'u1'), ('sec', 'u1'), ('valid', 'u1'),
+                ('utcStandard', 'u1')],
+}
+
+_MANIFEST = 'manifest.json'
+_SECONDS_IN_DAY = 86400
+_EPOCH_DAY = GPS_EPOCH_UNIX // _SECONDS_IN_DAY  # Unix day of the GPS epoch
+
+
+def _day_name(day):
+    """ Directory name of a GPS day (days since the GPS epoch). """
+    return str(np.datetime64(_EPOCH_DAY + int(day), 'D'))
+
+
+def _day_number(name):
+    """ GPS day of a day directory name. """
+    return int(np.datetime64(name, 'D').astype(np.int64)) - _EPOCH_DAY
+
+
+def _read_manifest(path):
+    """ Read the manifest of a day directory. """
+    try:
+        with open(os.path.join(path, _MANIFEST), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': 2, 'streams': {}}
+
+
+def _write_manifest(path, manifest):
+    """ Atomically replace the manifest of a day directory. """
+    tmp = os.path.join(path, _MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(path, _MANIFEST))
+
+
+def _column_path(path, stream, column):
+    """ File of one column of a stream in a day directory. """
+    return os.path.join(path, stream, column + '.npy')
+
+
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+_NPY_HEADER = 128  # Bytes of the .npy header of a column file, big enough for any row count
+
+
+def _npy_header(dtype, rows):
+    """ Version 1.0 .npy header of a one dimensional column, padded to a fixed size so that it can be rewritten in
+        place as rows are appended. """
+    text = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (rows,)})
+    text = text.ljust(_NPY_HEADER - len(_NPY_MAGIC) - 3) + '\n'
+    return _NPY_MAGIC + struct.pack('<H', len(text)) + text.encode('latin1')
+
+
+def _npy_rows(path):
+    """ Number of rows in the header of a column file. """
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        return np.lib.format.read_array_header_1_0(f)[0][0]
+
+
+def _segment_rows(path, stream, columns):
+    """ Number of complete rows of a stream in a day directory. Columns are appended one after the other, so after
+        a crash some may have more rows than others, and only the rows every column has are complete. """
+    rows = []
+    for column in columns:
+        try:
+            rows.append(_npy_rows(_column_path(path, stream, column)))
+        except FileNotFoundError:
+            return 0
+    return min(rows)
+
+
+class ArchiveWriter:
+    """ Class for archiving decoded packets to daily numpy column files.
+
+        Rows are buffered in fixed size arrays and written out by flush(), which is meant to be called once a minute.
+        A stream whose buffer fills up is flushed early so memory use is bounded by the buffer sizes. Each stream of
+        a day is one segment, a .npy file per column that every flush appends to, rewriting the row count in its
+        fixed size header. A day is a fixed number of files however often it is flushed. The day's manifest lists the
+        columns and their types and is only written when a stream starts in a day. Times are GPS time, so days are
+        GPS days. """
+    def __init__(self, root, rows=None):
+        self._root = root
+        rows = rows or {'rawx': 32768, 'hpposllh': 1024, 'timeutc': 1024}
+        self._buffers = {name: np.zeros(rows[name], dtype=cols) for name, cols in STREAMS.items()}
+        self._count = dict.fromkeys(STREAMS, 0)
+        self._segments = set()  # (day, stream) of the segments checked by this writer
+        self._week = None
+        self._tow = None
+        os.makedirs(root, exist_ok=True)
+
+    def _append(self, stream, row):
+        """ Append one row to the buffer of a stream. """
+        if self._count[stream] == len(self._buffers[stream]):
+            self._flush_stream(stream)
+        self._buffers[stream][self._count[stream]] = row
+        self._count[stream] += 1
+
+    def append_rawx(self, packet):
+        """ Append each measurement of an RxmRawx packet. """
+        self._week, self._tow = packet.week, packet.rcvTow
+        t = float(gps_seconds(packet.week, packet.rcvTow))
+        for m in packet.measurements:
+            trk = m.prValid | m.cpValid << 1 | m.halfCyc << 2 | m.subHalfCyc << 3
+            self._append('rawx', (t, packet.week, packet.rcvTow, packet.leapS, m.gnssId, m.svId, m.sigId, m.freqId,
+                                  m.prMeas, m.cpMeas, m.doMeas, m.cno, m.locktime, m.prStdev, m.cpStdev, m.doStdev,
+                                  trk))
+
+    def append_rawx_payload(self, payload):
+        """ Append each measurement of a UBX-RXM-RAWX payload without decoding it into an RxmRawx packet. """
+        rcvTow, week, leapS, num = struct.unpack_from('<dHbB', payload)
+        self._week, self._tow = week, rcvTow
+        if self._count['rawx'] + num > len(self._buffers['rawx']):
+            self._flush_stream('rawx')
+        n = self._count['rawx']
+        rows = self._buffers['rawx'][n:n + num]
+        meas = np.frombuffer(payload, dtype=RAWX_DTYPE, count=num, offset=16)
+        rows['t'] = float(gps_seconds(week, rcvTow))
+        rows['week'] = week
+        rows['rcvTow'] = rcvTow
+        rows['leapS'] = leapS
+        for column in ('gnssId', 'svId', 'sigId', 'freqId', 'prMeas', 'cpMeas', 'doMeas', 'cno', 'locktime'):
+            rows[column] = meas[column]
+        rows['prStdev'] = 0.01 * 2. ** (meas['prStdev'] & 0x0f)
+        rows['cpStdev'] = (meas['cpStdev'] & 0x0f) * .004
+        rows['doStdev'] = 0.02 * 2. ** (meas['doStdev'] & 0x0f)
+        rows['trkStat'] = meas['trkStat'] & 0x0f  # Same bits as the flags of RxmRawxData
+        self._count['rawx'] += num
+
+    def append_pos(self, packet):
+        """ Append a NavHPPOSLLH packet. The week number comes from the last RxmRawx packet, so position rows are
+            only archived once raw data has been seen. """
+        if self._week is None:
+            return
+        tow = packet.iTOW / 1000
+        week = self._week
+        if tow - self._tow < -SECONDS_IN_WEEK / 2:  # Position is already in the next week
+            week += 1
+        self._append('hpposllh', (float(gps_seconds(week, tow)), packet.iTOW, packet.lon, packet.lat,
+                                  packet.height, packet.hMSL, packet.hAcc, packet.vAcc))
+
+    def append_time(self, packet):
+        """ Append a NavTimeUTC packet. """
+        unix = utc_to_unix(packet.year, packet.month, packet.day, packet.hour, packet.min, packet.sec, packet.nano)
+        t = float(unix - GPS_EPOCH_UNIX + leap_seconds_unix(unix))
+        valid = packet.validTOW | packet.validWKN << 1 | packet.validUTC << 2
+        self._append('timeutc', (t, packet.iTOW, packet.tAcc, packet.nano, packet.year, packet.month, packet.day,
+                                 packet.hour, packet.min, packet.sec, valid, packet.utcStandard))
+
+    def flush(self):
+        """ Write all buffered rows to disk. """
+        for stream in STREAMS:
+            self._flush_stream(stream)
+
+    def _flush_stream(self, stream):
+        """ Append the buffered rows of one stream to the segment of each day they fall in. """
+        n = self._count[stream]
+        if not n:
+            return
+        rows = self._buffers[stream][:n]
+        days = (rows['t'] // _SECONDS_IN_DAY).astype(np.int64)
+        for day in np.unique(days):
+            self._append_segment(stream, int(day), rows[days == day])
+        self._count[stream] = 0
+
+    def _open_segment(self, stream, name):
+        """ Prepare the segment of a stream in a day directory for appending. A new segment is added to the
+            manifest, rows left incomplete by a crash are cut off an existing one. """
+        path = os.path.join(self._root, name)
+        columns = dict(STREAMS[stream])
+        manifest = _read_manifest(path)
+        if stream not in manifest['streams']:
+            os.makedirs(os.path.join(path, stream), exist_ok=True)
+            for column, dtype in columns.items():
+                with open(_column_path(path, stream, column), 'wb') as f:
+                    f.write(_npy_header(dtype, 0))
+            manifest['streams'][stream] = {'columns': columns}
+            _write_manifest(path, manifest)
+        else:
+            rows = _segment_rows(path, stream, columns)
+            for column, dtype in columns.items():
+                with open(_column_path(path, stream, column), 'r+b') as f:
+                    f.truncate(_NPY_HEADER + rows * np.dtype(dtype).itemsize)
+                    f.write(_npy_header(dtype, rows))
+        self._segments.add((name, stream))
+
+    def _append_segment(self, stream, day, rows):
+        """ Append rows of one day to the segment of a stream. The data of each column is written before its header
+            is updated, so a column file always holds at least the rows its header says. """
+        name = _day_name(day)
+        if (name, stream) not in self._segments:
+            self._open_segment(stream, name)
+        path = os.path.join(self._root, name)
+        for column in rows.dtype.names:
+            dtype = rows.dtype[column]
+            with open(_column_path(path, stream, column), 'r+b') as f:
+                end = f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(rows[column]).tobytes())
+                f.flush()
+                f.seek(0)
+                f.write(_npy_header(dtype, (end - _NPY_HEADER) // dtype.itemsize + len(rows)))
+
+    def close(self):
+        """ Flush remaining rows. """
+        self.flush()
+
+
+class ArchiveReader:
+    """ Class for reading an archive written by ArchiveWriter without copying it into memory.
+
+        Every column of a day is a .npy file that np.load(..., mmap_mode='r') can open directly. Only the days that
+        overlap the requested times are opened, and each day is returned as its own set of memory maps, so a long
+        range is never copied into memory. Each mapped column holds a file descriptor until its arrays are
+        dropped. """
+    def __init__(self, root):
+        self._root = root
+
+    def days(self):
+        """ Sorted names of the archived days. """
+        return sorted(i for i in os.listdir(self._root) if os.path.isfile(os.path.join(self._root, i, _MANIFEST)))
+
+    def _segments(self, stream, start, stop):
+        """ Generator of (day directory, rows) of the segments of a stream that can hold GPS times in
+            [start, stop). """
+        for day in self.days():
+            number = _day_number(day)
+            if (start is not None and (number + 1) * _SECONDS_IN_DAY <= start) or \
+                    (stop is not None and number * _SECONDS_IN_DAY >= stop):
+                continue
+            path = os.path.join(self._root, day)
+            info = _read_manifest(path)['streams'].get(stream)
+            if info is None:
+                continue
+            rows = _segment_rows(path, stream, info['columns'])
+            if rows:
+                yield path, rows
+
+    def chunks(self, stream, start=None, stop=None, columns=None):
+        """ Generator of dictionaries of memory mapped column arrays, one per day, sliced to GPS times in
+            [start, stop). """
+        columns = columns or [i[0] for i in STREAMS[stream]]
+        for path, rows in self._segments(stream, start, stop):
+            t = np.load(_column_path(path, stream, 't'), mmap_mode='r')[:rows]
+            i0 = 0 if start is None else int(np.searchsorted(t, start, side='left'))
+            i1 = rows if stop is None else int(np.searchsorted(t, stop, side='left'))
+            del t
+            if i0 < i1:
+                yield {i: np.load(_column_path(path, stream, i), mmap_mode='r')[i0:i1] for i in columns}
+
+    def load(self, stream, start=None, stop=None, columns=None):
+        """ List of dictionaries of memory mapped column arrays of a stream for GPS times in [start, stop), one per
+            day. Use np.concatenate on a column to get it in one array, which copies it into memory. """
+        return list(self.chunks(stream, start, stop, columns))
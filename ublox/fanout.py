@@ -0,0 +1,170 @@
+import struct
+import time
+import logging
+from dataclasses import dataclass
+from .messages import RAWX_DTYPE
+from .ublox_reader import MAX_PAYLOAD
+
+
+_MAGIC = b'UBXRING1'
+_HEADER = struct.Struct('<8sIIQ')  # Magic, number of slots, payload bytes per slot, sequence number of last frame
+_SLOT = struct.Struct('<QHHI')  # Sequence number (0 while being written), msg_id, unused, payload length
+_HEADER_SIZE = 64
+_SEQ_OFFSET = 16
+
+
+def _attach(name):
+    """ Attach to existing shared memory without handing it to this process's resource tracker, which would unlink
+        it when the process exits. """
+    from multiprocessing import shared_memory, resource_tracker
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister('/' + shm.name, 'shared_memory')  # Tracked under the POSIX name
+        return shm
+
+
+def rawx_measurements(payload):
+    """ Numpy structured array view of the measurements of a UBX-RXM-RAWX payload. """
+    import numpy as np
+    num = payload[11]
+    return np.frombuffer(payload, dtype=RAWX_DTYPE, count=num, offset=16)
+
+
+@dataclass(frozen=True)
+class Frame:
+    """ Dataclass for a frame read from the ring. The payload is a read only view into shared memory. """
+    seq: int
+    msg_id: int
+    payload: memoryview
+
+
+class RingPublisher:
+    """ Class for publishing received packets to a shared memory ring buffer.
+
+        Each packet is copied once into the next slot of the ring, whatever the number of subscribers. The slot's
+        sequence number is cleared while it is written and set after, so subscribers can tell a finished frame from
+        one that is being overwritten. Slots hold the longest payload the framer accepts by default. Packets that do
+        not fit a smaller slot_size are skipped and counted in dropped, so they cannot stop the reader. Pages of the
+        ring are only backed by memory once they are written to. """
+    def __init__(self, name, slots=1024, slot_size=MAX_PAYLOAD):
+        from multiprocessing import shared_memory
+        self._slots = slots
+        self._slot_size = slot_size
+        self._stride = _SLOT.size + slot_size
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER_SIZE + slots * self._stride)
+        self._buf = self._shm.buf
+        _HEADER.pack_into(self._buf, 0, _MAGIC, slots, slot_size, 0)
+        self._seq = 0
+        self._dropped = 0
+
+    def publish(self, msg_id, payload):
+        """ Write one packet to the ring. Returns False if the packet was too long for a slot and was skipped. """
+        length = len(payload)
+        if length > self._slot_size:
+            self._dropped += 1
+            logging.warning(f'Packet {msg_id:#06x} of {length} bytes does not fit in a {self._slot_size} byte ring '
+                            f'slot and was not published')
+            return False
+        seq = self._seq + 1
+        buf = self._buf
+        offset = _HEADER_SIZE + (seq % self._slots) * self._stride
+        _SLOT.pack_into(buf, offset, 0, msg_id, 0, length)
+        buf[offset + _SLOT.size:offset + _SLOT.size + length] = payload
+        struct.pack_into('<Q', buf, offset, seq)
+        struct.pack_into('<Q', buf, _SEQ_OFFSET, seq)
+        self._seq = seq
+        return True
+
+    def close(self):
+        """ Close and remove the ring. """
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+
+class RingSubscriber:
+    """ Class for reading packets from a ring created by RingPublisher in another process.
+
+        Frames are returned as views into shared memory without copying. A subscriber that falls more than a ring
+        behind skips to the oldest frame still in the ring and counts the skipped frames as overruns. A frame's
+        payload stays valid until the publisher wraps around to its slot, which intact() checks. """
+    def __init__(self, name, latest=True):
+        self._shm = _attach(name)
+        self._buf = self._shm.buf.toreadonly()
+        magic, self._slots, self._slot_size, seq = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"'{name}' is not a ublox ring buffer")
+        self._stride = _SLOT.size + self._slot_size
+        self._next = seq + 1 if latest else max(seq - self._slots + 1, 1)
+        self._overruns = 0
+
+    def _head(self):
+        """ Sequence number of the last published frame. """
+        return struct.unpack_from('<Q', self._buf, _SEQ_OFFSET)[0]
+
+    def read(self):
+        """ Next frame, or None if there is no new frame. """
+        while True:
+            head = self._head()
+            if self._next > head:
+                return None
+            if head - self._next >= self._slots:  # Publisher has lapped us
+                oldest = head - self._slots + 1
+                self._overruns += oldest - self._next
+                self._next = oldest
+            offset = _HEADER_SIZE + (self._next % self._slots) * self._stride
+            seq, msg_id, _, length = _SLOT.unpack_from(self._buf, offset)
+            if seq != self._next:  # Slot is being overwritten, skip ahead
+                self._overruns += 1
+                self._next += 1
+                continue
+            self._next += 1
+            return Frame(seq, msg_id, self._buf[offset + _SLOT.size:offset + _SLOT.size + length])
+
+    def frames(self, poll=0.001):
+        """ Generator of frames that waits for new frames by polling. """
+        while True:
+            frame = self.read()
+            if frame is None:
+                time.sleep(poll)
+            else:
+                yield frame
+
+    def intact(self, frame):
+        """ Check that a frame has not been overwritten since it was read. """
+        offset = _HEADER_SIZE + (frame.seq % self._slots) * self._stride
+        return struct.unpack_from('<Q', self._buf, offset)[0] == frame.seq
+
+    def close(self):
+        """ Detach from the ring. Frames read from it can not be used after this.
+
+            Payloads of frames, and arrays made from them such as rawx_measurements(), must be dropped first. If any
+            are still alive BufferError is raised and the ring stays mapped, nothing more can be read, and close()
+            can be called again once they are gone. """
+        self._buf.release()
+        try:
+            self._shm.close()
+        except BufferError:
+            raise BufferError(f'Frames of ring {self._shm.name} are still in use, drop them before close()') from None
+
+    @property
+    def overruns(self):
+        return self._overruns
+
+    @property
+    def lag(self):
+        return self._head() - self._next + 1
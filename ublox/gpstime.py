@@ -0,0 +1,133 @@
+import time
+import numpy as np
+
+
+SECONDS_IN_WEEK = 604800
+GPS_EPOCH_UNIX = 315964800  # 1980-01-06 00:00:00 UTC in Unix seconds
+J2000_UNIX = 946728000  # 2000-01-01 12:00:00 UTC in Unix seconds
+
+# Table of leap seconds: (Unix time the offset takes effect, GPS - UTC offset in seconds)
+_LEAP_SECONDS = (
+    (362793600, 1),    # 1981-07-01
+    (394329600, 2),    # 1982-07-01
+    (425865600, 3),    # 1983-07-01
+    (489024000, 4),    # 1985-07-01
+    (567993600, 5),    # 1988-01-01
+    (631152000, 6),    # 1990-01-01
+    (662688000, 7),    # 1991-01-01
+    (709948800, 8),    # 1992-07-01
+    (741484800, 9),    # 1993-07-01
+    (773020800, 10),   # 1994-07-01
+    (820454400, 11),   # 1996-01-01
+    (867715200, 12),   # 1997-07-01
+    (915148800, 13),   # 1999-01-01
+    (1136073600, 14),  # 2006-01-01
+    (1230768000, 15),  # 2009-01-01
+    (1341100800, 16),  # 2012-07-01
+    (1435708800, 17),  # 2015-07-01
+    (1483228800, 18),  # 2017-01-01
+)
+_LEAP_UNIX = np.array([0] + [i[0] for i in _LEAP_SECONDS], dtype=np.float64)
+_LEAP_OFFSET = np.array([0] + [i[1] for i in _LEAP_SECONDS], dtype=np.int64)
+_LEAP_GPS = _LEAP_UNIX - GPS_EPOCH_UNIX + _LEAP_OFFSET  # Same table in GPS seconds
+
+
+def unix_now():
+    """ Current Unix time in seconds. """
+    return time.time()
+
+
+def second_of_minute(tow, leapS):
+    """ Second of the UTC minute for a GPS time of week in seconds and a leap second offset. """
+    return (tow - leapS) % 60
+
+
+def unroll_week(week, ref_week=None):
+    """ Takes in GPS week numbers modulo 1024 (broadcast week) and returns the full week numbers closest to a
+        reference week. The reference defaults to the current week from the system clock. """
+    week = np.asarray(week, dtype=np.int64)
+    if ref_week is None:
+        ref_week = int((unix_now() - GPS_EPOCH_UNIX) // SECONDS_IN_WEEK)
+    return week % 1024 + 1024 * np.round((ref_week - week % 1024) / 1024).astype(np.int64)
+
+
+def gps_seconds(week, tow):
+    """ Seconds since the GPS epoch for a week number and time of week. A time of week outside of
+        [0, 604800) rolls over into the neighbouring week. """
+    return np.asarray(week, dtype=np.int64) * SECONDS_IN_WEEK + np.asarray(tow, dtype=np.float64)
+
+
+def leap_seconds(gps):
+    """ GPS - UTC offset from the leap second table for times in seconds since the GPS epoch. """
+    return _LEAP_OFFSET[np.searchsorted(_LEAP_GPS, gps, side='right') - 1]
+
+
+def leap_seconds_unix(unix):
+    """ GPS - UTC offset from the leap second table for Unix times. """
+    return _LEAP_OFFSET[np.searchsorted(_LEAP_UNIX, unix, side='right') - 1]
+
+
+def gps_to_unix(week, tow, leapS=None):
+    """ Convert GPS week and time of week to Unix time. Uses the receiver leap second offset if given, otherwise the
+        built in leap second table. """
+    gps = gps_seconds(week, tow)
+    if leapS is None:
+        leapS = leap_seconds(gps)
+    return gps + GPS_EPOCH_UNIX - leapS
+
+
+def gps_to_j2000(week, tow, leapS=None):
+    """ Convert GPS week and time of week to seconds since J2000 (2000-01-01 12:00:00 UTC). """
+    return gps_to_unix(week, tow, leapS) - J2000_UNIX
+
+
+def gps_to_utc(week, tow, leapS=None):
+    """ Convert GPS week and time of week to UTC as numpy datetime64[ns]. """
+    return unix_to_datetime64(gps_to_unix(week, tow, leapS))
+
+
+def unix_to_gps(unix):
+    """ Convert Unix time to GPS week and time of week using the leap second table. """
+    gps = np.asarray(unix, dtype=np.float64) - GPS_EPOCH_UNIX + leap_seconds_unix(unix)
+    week = (gps // SECONDS_IN_WEEK).astype(np.int64)
+    return week, gps - week * SECONDS_IN_WEEK
+
+
+def unix_to_datetime64(unix):
+    """ Convert Unix time in seconds to numpy datetime64[ns]. """
+    unix = np.asarray(unix, dtype=np.float64)
+    sec = np.floor(unix)
+    ns = np.round((unix - sec) * 1e9).astype(np.int64)
+    return (sec.astype(np.int64) * 10**9 + ns).astype('datetime64[ns]')
+
+
+def utc_to_unix(year, month, day, hour, minute, sec, nano=0):
+    """ Convert UTC calendar fields to Unix time. A leap second (sec == 60) maps onto the start of the next minute
+        and nano may be negative, as in UBX-NAV-TIMEUTC. """
+    year, month, day = (np.asarray(i, dtype=np.int64) for i in (year, month, day))
+    days = ((year - 1970).astype('datetime64[Y]') + (month - 1).astype('timedelta64[M]')).astype('datetime64[D]') \
+        + (day - 1).astype('timedelta64[D]')
+    seconds = days.astype(np.int64) * 86400 + np.asarray(hour, dtype=np.int64) * 3600 \
+        + np.asarray(minute, dtype=np.int64) * 60 + np.asarray(sec, dtype=np.int64)
+    return seconds + np.asarray(nano, dtype=np.int64) * 1e-9
+
+
+def rawx_times(messages):
+    """ Takes in RxmRawx packets and returns arrays of (week, rcvTow, leapS). """
+    n = len(messages)
+    week = np.fromiter((i.week for i in messages), dtype=np.int64, count=n)
+    tow = np.fromiter((i.rcvTow for i in messages), dtype=np.float64, count=n)
+    leapS = np.fromiter((i.leapS for i in messages), dtype=np.int64, count=n)
+    return week, tow, leapS
+
+
+def rawx_to_unix(messages):
+    """ Unix time of each RxmRawx packet using the leap second offset it was received with. """
+    return gps_to_unix(*rawx_times(messages))
+
+
+def timeutc_to_unix(messages):
+    """ Unix time of each NavTimeUTC packet. """
+    fields = np.array([(i.year, i.month, i.day, i.hour, i.min, i.sec, i.nano) for i in messages],
+                      dtype=np.int64).reshape(-1, 7)
+    return utc_to_unix(*fields.T)
@@ -0,0 +1,161 @@
+import os
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .api import decode_pos_packet, decode_raw_packet
+
+
+_DECODERS = {'rawgps': decode_raw_packet, 'posgps': decode_pos_packet}
+
+
+class IngestServer:
+    """ Local stand-in for the cods.colorado.edu ingest API.
+
+        Accepts POST /api/gpslidar/rawgps/<location> and /api/gpslidar/posgps/<location> like the real server: the
+        JWT in the Bearer header is checked against the public key of the location, the body is decoded and 201 is
+        returned. Latency (plus uniform jitter), a rate of 500 errors and outages (503 for every request) can be
+        injected to test uploads against a bad link. Decoded bodies are kept in received when keep is True. """
+    def __init__(self, public_keys, host='127.0.0.1', port=0, latency=0., jitter=0., error_rate=0., outages=(),
+                 keep=True, seed=None):
+        self._public_keys = public_keys  # Location -> PEM public key, or a directory of <location>.pub files
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = error_rate
+        self._outages = list(outages)  # (start, stop) in seconds after start()
+        self._outage_until = 0.
+        self._keep = keep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._start = None
+        self.received = {}  # (kind, location) -> list of decoded bodies
+        self._stats = {'requests': 0, 'accepted': 0, 'bytes': 0, 'epochs': 0, 'measurements': 0,
+                       'unauthorized': 0, 'bad_request': 0, 'injected_errors': 0, 'outage_rejects': 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                code = server._handle(self.path, self.headers.get('Bearer', ''), body)
+                self.send_response(code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logging.debug('Ingest: ' + format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def _public_key(self, location):
+        """ Public key of a location, or None if it is not known. """
+        if isinstance(self._public_keys, dict):
+            return self._public_keys.get(location)
+        try:
+            with open(os.path.join(self._public_keys, location + '.pub'), 'r') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _handle(self, path, token, body):
+        """ Handle one POST and return the status code. """
+        import jwt
+        self._count('requests')
+        delay = self._latency + self._random.uniform(0, self._jitter)
+        if delay > 0:
+            time.sleep(delay)
+        now = time.monotonic() - self._start
+        if now < self._outage_until or any(a <= now < b for a, b in self._outages):
+            self._count('outage_rejects')
+            return 503
+        if self._random.random() < self._error_rate:
+            self._count('injected_errors')
+            return 500
+
+        parts = path.strip('/').split('/')
+        if len(parts) != 4 or parts[:2] != ['api', 'gpslidar'] or parts[2] not in _DECODERS:
+            return 404
+        kind, location = parts[2], parts[3]
+        key = self._public_key(location)
+        try:
+            jwt.decode(token, key, algorithms=['RS256'])
+        except (jwt.InvalidTokenError, ValueError, TypeError):
+            self._count('unauthorized')
+            return 401
+        try:
+            decoded = _DECODERS[kind](body)
+        except ValueError:
+            self._count('bad_request')
+            return 400
+
+        with self._lock:
+            self._stats['accepted'] += 1
+            self._stats['bytes'] += len(body)
+            if kind == 'rawgps':
+                self._stats['epochs'] += len(decoded['rcvTow'])
+                self._stats['measurements'] += len(decoded['prMeas'])
+            if self._keep:
+                self.received.setdefault((kind, location), []).append(decoded)
+        return 201
+
+    def outage(self, seconds):
+        """ Answer every request with 503 for the next seconds. """
+        self._outage_until = time.monotonic() - self._start + seconds
+
+    def start(self):
+        """ Start serving in a background thread. """
+        self._start = time.monotonic()
+        self._thread.start()
+        return self
+
+    def close(self):
+        """ Stop serving. """
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/gpslidar/'
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the GPS ingest server.')
+    parser.add_argument('-k', '--keys', type=str, required=True, help='Directory of <location>.pub public keys')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on. Default is 127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='Port to listen on. Default is 8000')
+    parser.add_argument('--latency', type=float, default=0., help='Seconds added to every request. Default is 0')
+    parser.add_argument('--jitter', type=float, default=0., help='Maximum random extra latency. Default is 0')
+    parser.add_argument('--error-rate', type=float, default=0., help='Fraction of requests answered with 500')
+    parser.add_argument('--outage', type=float, nargs=2, action='append', default=[], metavar=('START', 'STOP'),
+                        help='Answer 503 between START and STOP seconds after starting. Can be repeated.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = IngestServer(args.keys, args.host, args.port, args.latency, args.jitter, args.error_rate, args.outage,
+                          keep=False).start()
+    logging.info('Ingest stand-in listening at ' + server.url)
+    try:
+        while True:
+            time.sleep(60)
+            logging.info('Ingest stats: ' + str(server.stats))
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
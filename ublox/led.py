@@ -1,32 +1,40 @@
-import RPi.GPIO as GPIO
-import datetime as dt
-
-
 class LED:
     """ Class for controlling blinking LED. """
     def __init__(self, pin):
         """ Initialize GPIO pin. """
+        import RPi.GPIO as GPIO  # Only available on the Raspberry Pi
+        self._gpio = GPIO
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         GPIO.setup(pin, GPIO.OUT)
         self._light = False
         self._pin = pin
-        self._timer = dt.datetime.now()
 
     def switch(self):
         """ Switch LED state. """
-        if (dt.datetime.now() - self._timer).total_seconds() >= 1:
-            if self._light:
-                self.set_low()
-            else:
-                self.set_high()
+        if self._light:
+            self.set_low()
+        else:
+            self.set_high()
 
     def set_low(self):
         """ Turn LED off. """
-        GPIO.output(self._pin, GPIO.LOW)
+        self._gpio.output(self._pin, self._gpio.LOW)
         self._light = False
 
     def set_high(self):
         """ Turn LED on. """
-        GPIO.output(self._pin, GPIO.HIGH)
+        self._gpio.output(self._pin, self._gpio.HIGH)
         self._light = True
+
+
+class NullLED:
+    """ Class with the interface of LED that does nothing, for running without GPIO. """
+    def switch(self):
+        pass
+
+    def set_low(self):
+        pass
+
+    def set_high(self):
+        pass
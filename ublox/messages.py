@@ -34,6 +34,11 @@ _LOOKUPTABLE = {
 # Lookup table for GPS codes
 _LOOKUP_GPS = {0: 'G', 1: 'S', 2: 'E', 3: 'C', 6: 'R'}
 
+# Numpy dtype of one measurement of a UBX-RXM-RAWX payload, after the 16 byte header
+RAWX_DTYPE = [('prMeas', '<f8'), ('cpMeas', '<f8'), ('doMeas', '<f4'), ('gnssId', 'u1'), ('svId', 'u1'),
+              ('sigId', 'u1'), ('freqId', 'u1'), ('locktime', '<u2'), ('cno', 'u1'), ('prStdev', 'u1'),
+              ('cpStdev', 'u1'), ('doStdev', 'u1'), ('trkStat', 'u1'), ('reserved', 'u1')]
+
 
 def str2type(type, string):
     """ Takes in string and type and returns desired value. """
@@ -263,8 +268,8 @@ class NavHPPOSLLH(ReceivedPacket):
         self._lat = 10**-7 * (lat_tmp + lat_hp * 10**-2)  # degrees
         self._height = (height_tmp + 0.1*height_hp) / 1000  # meters above ellipsoid
         self._hMSL = (hMSL_tmp + 0.1*hMSL_hp) / 1000  # meters above mean sea level
-        self._vAcc = (vAcc_tmp * 0.1) / 1000  # meters horizontal accuracy estimate
-        self._hAcc = (hAcc_tmp * 0.1) / 1000  # meters - vertical accuracy estimate
+        self._vAcc = (vAcc_tmp * 0.1) / 1000  # meters vertical accuracy estimate
+        self._hAcc = (hAcc_tmp * 0.1) / 1000  # meters horizontal accuracy estimate
 
     def __str__(self):
         return f'Received Packet:    {self.longname}, ID: {self.id}\n' \
@@ -300,7 +305,7 @@ class NavHPPOSLLH(ReceivedPacket):
 
     @property
     def hAcc(self):
-        return self._vAcc
+        return self._hAcc
 
 
 # Receive clock data from GPS
@@ -329,10 +334,19 @@ class NavTimeUTC(ReceivedPacket):
 
     @property
     def time_dt(self):
-        if self._sec == 60:
-            return dt.datetime(self._year, self._month, self._day, self._hour, self._min, 59, self._nano // 1000)
-        else:
-            return dt.datetime(self._year, self._month, self._day, self._hour, self._min, self._sec, self._nano // 1000)
+        # datetime cannot represent a leap second, use time_unix for exact time
+        return dt.datetime(self._year, self._month, self._day, self._hour, self._min, min(self._sec, 59)) + \
+            dt.timedelta(microseconds=self._nano // 1000)
+
+    @property
+    def time_unix(self):
+        from .gpstime import utc_to_unix
+        return utc_to_unix(self._year, self._month, self._day, self._hour, self._min, self._sec, self._nano).item()
+
+    @property
+    def time_j2000(self):
+        from .gpstime import J2000_UNIX
+        return self.time_unix - J2000_UNIX
 
     @property
     def iTOW(self):
@@ -444,6 +458,7 @@ class RxmRawx(ReceivedPacket):
 
             dc.append(RxmRawxData(pr_tmp, cp_tmp, do_tmp, gnss_tmp, sv_tmp, sig_tmp, freq_tmp, locktime_tmp, cno_tmp,
                                         prSt_tmp, cpSt_tmp, doSt_tmp, *x2bool(4, trkSt_tmp), key))
+        self._measurements = dc
         dd = defaultdict(list)
         self._satellites = []
         for i in dc:
@@ -494,3 +509,7 @@ class RxmRawx(ReceivedPacket):
     @property
     def satellites(self):
         return self._satellites
+
+    @property
+    def measurements(self):
+        return self._measurements
@@ -0,0 +1,231 @@
+import os
+import struct
+import threading
+import numpy as np
+from .api import _RAW_HEADER, _RAW_SIZE
+from .gpstime import second_of_minute
+from .messages import RAWX_DTYPE, NavHPPOSLLH, RxmRawx
+
+
+# Epoch header and measurement of a raw packet, as made by api.raw_packet
+_HEADER_DTYPE = np.dtype([('rcvTow', '<f8'), ('week', '<u2'), ('leapS', 'i1'), ('numMeas', 'u1')])
+_MEAS_DTYPE = np.dtype([('prMeas', '<f8'), ('cpMeas', '<f8'), ('doMeas', '<f4'), ('other', '<u2')])
+
+# Rank of the first letter of the satellite key of each gnssId ('' < 'C' < 'E' < 'G' < 'R' < 'S'), which orders the
+# measurements of an epoch like RxmRawx.satellites does. Systems without a letter go last.
+_RANK = np.full(256, 6, dtype=np.int64)
+_RANK[[3, 2, 0, 6, 1]] = [1, 2, 3, 4, 5]
+
+
+def rss_bytes():
+    """ Resident set size of this process in bytes. """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:  # No procfs, use the peak instead
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class BufferPool:
+    """ Class for a fixed set of reusable byte buffers. acquire() returns None when all buffers are in use, which is
+        the signal for back-pressure. """
+    def __init__(self, count, size):
+        self._size = size
+        self._free = [bytearray(size) for _ in range(count)]
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Take a buffer from the pool, or None if there is none free. """
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    def release(self, buff):
+        """ Give a buffer back to the pool. """
+        with self._lock:
+            self._free.append(buff)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def available(self):
+        with self._lock:
+            return len(self._free)
+
+
+class RawMinute:
+    """ Class for a minute of RXM-RAWX data in preallocated arrays that are reused from minute to minute.
+
+        Payloads are copied straight into the arrays, no packet objects are made. encode() writes the same bytes as
+        api.raw_packet would for the RxmRawx packets of the minute. """
+    def __init__(self, max_epochs=1200, max_meas=76800):
+        self._headers = np.zeros(max_epochs, dtype=_HEADER_DTYPE)
+        self._meas = np.zeros(max_meas, dtype=RAWX_DTYPE)
+        self._epoch = np.zeros(max_meas, dtype=np.int64)  # Epoch of each measurement
+        self._epochs = 0
+        self._count = 0
+
+    def add(self, payload):
+        """ Add a RXM-RAWX payload. Returns False if the minute is full. """
+        rcvTow, week, leapS, num = _RAW_HEADER.unpack_from(payload)
+        n, e = self._count, self._epochs
+        if e == len(self._headers) or n + num > len(self._meas):
+            return False
+        self._headers[e] = (rcvTow, week, leapS, num)
+        self._meas[n:n + num] = np.frombuffer(payload, dtype=RAWX_DTYPE, count=num, offset=16)
+        self._epoch[n:n + num] = e
+        self._epochs += 1
+        self._count += num
+        return True
+
+    def reset(self):
+        """ Empty the minute, keeping the arrays. """
+        self._epochs = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._epochs
+
+    @property
+    def nbytes(self):
+        """ Size of the encoded minute. """
+        return self._epochs * _RAW_HEADER.size + self._count * _RAW_SIZE
+
+    def encode(self, out=None):
+        """ Encode the minute like api.raw_packet. Writes into the bytearray out if given, which must be at least
+            nbytes long, and returns a memoryview of the encoded bytes. """
+        size = self.nbytes
+        out = bytearray(size) if out is None else out
+        if not size:
+            return memoryview(out)[:0]
+        buff = np.frombuffer(out, dtype=np.uint8, count=size)
+        e, n = self._epochs, self._count
+        headers = self._headers[:e]
+        meas = self._meas[:n]
+
+        # Order within each epoch by satellite key, then signal. lexsort is stable, so ties keep the received order.
+        gnss, sv = meas['gnssId'], meas['svId'].astype(np.int64)
+        rank = _RANK[gnss]
+        glonass_unknown = (gnss == 6) & (sv == 255)
+        rank[glonass_unknown] = 0
+        sv[glonass_unknown] = 0
+        sv[gnss == 1] -= 100
+        order = np.lexsort((meas['sigId'], sv, rank, self._epoch[:n]))
+        meas = meas[order]
+
+        records = np.empty(n, dtype=_MEAS_DTYPE)
+        records['prMeas'] = meas['prMeas']
+        records['cpMeas'] = meas['cpMeas']
+        records['doMeas'] = meas['doMeas']
+        cno = np.clip(meas['cno'] // 6, 1, 9).astype(np.uint16)  # Same clipping as raw_packet, 8 and 9 wrap around
+        records['other'] = (((meas['gnssId'] & 0x07).astype(np.uint16) << 12) |
+                            ((meas['svId'] & 0x3f).astype(np.uint16) << 6) |
+                            ((meas['sigId'] & 0x07).astype(np.uint16) << 3) | (cno & 0x07))
+
+        # Each epoch header is followed by its measurements
+        nums = headers['numMeas'].astype(np.int64)
+        starts = np.arange(e) * _RAW_HEADER.size + np.concatenate(([0], np.cumsum(nums)[:-1])) * _RAW_SIZE
+        header_bytes = (starts[:, None] + np.arange(_RAW_HEADER.size)).ravel()
+        mask = np.ones(size, dtype=bool)
+        mask[header_bytes] = False
+        buff[header_bytes] = headers.view(np.uint8)
+        buff[mask] = records.view(np.uint8)
+        return memoryview(out)[:size]
+
+
+class PosMinute:
+    """ Class for a minute of NAV-HPPOSLLH positions in preallocated arrays. encode() writes the same bytes as
+        api.pos_packet. """
+    def __init__(self, max_epochs=1200):
+        self._pos = np.zeros(max_epochs, dtype=[('iTOW', '<f8'), ('lon', '<f8'), ('lat', '<f8'), ('height', '<f8')])
+        self._count = 0
+
+    def add(self, packet):
+        """ Add the position of a NavHPPOSLLH packet. Returns False if the minute is full. """
+        if self._count == len(self._pos):
+            return False
+        self._pos[self._count] = (packet.iTOW, packet.lon, packet.lat, packet.height)
+        self._count += 1
+        return True
+
+    def reset(self):
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def encode(self, week, leapS):
+        """ Encode the average position of the minute like api.pos_packet. """
+        pos = self._pos[:self._count]
+        return struct.pack('<IHddd', int(np.mean(pos['iTOW']) - leapS * 1000), week, np.mean(pos['lon']),
+                           np.mean(pos['lat']), np.mean(pos['height']))
+
+
+class MinuteCollector:
+    """ Class for splitting the received packets into minutes with bounded memory.
+
+        The split follows the same rules as the reader loop, but each stream is closed as soon as it wraps to a new
+        minute. RXM-RAWX minutes are encoded into buffers from the pool, NAV-HPPOSLLH minutes are 30 bytes and are
+        not pooled. feed() returns the closed minutes as (kind, data, buffer) with kind 'raw' or 'pos'. buffer is
+        the pool buffer holding data, to be given back with pool.release() once the data has been sent or saved,
+        or None if the data does not come from the pool. A raw minute is encoded into a new buffer when the pool is
+        empty, and pool_empty is counted so the caller can tell the uploads are falling behind. """
+    def __init__(self, pool, max_epochs=1200, max_meas=76800):
+        self._pool = pool
+        self._raw = RawMinute(max_epochs, max_meas)
+        self._pos = PosMinute(max_epochs)
+        self._prev_raw = 0
+        self._prev_pos = 0
+        self.week = None
+        self.leapS = None
+        self.pool_empty = 0
+
+    def _close_raw(self):
+        """ Encode the raw minute and empty it. """
+        buff = self._pool.acquire() if self._raw.nbytes <= self._pool.size else None
+        if buff is None:
+            self.pool_empty += 1
+        data = self._raw.encode(buff)
+        self._raw.reset()
+        return 'raw', data, buff
+
+    def _close_pos(self):
+        """ Encode the position minute and empty it. """
+        data = self._pos.encode(self.week, self.leapS)
+        self._pos.reset()
+        return 'pos', data, None
+
+    def feed(self, msg_id, payload):
+        """ Add a packet. Returns the list of minutes it closed. """
+        done = []
+        if msg_id == RxmRawx.id:
+            rcvTow, week, leapS = _RAW_HEADER.unpack_from(payload)[:3]
+            mod_raw = second_of_minute(rcvTow, leapS)
+            if mod_raw < self._prev_raw and len(self._raw):
+                done.append(self._close_raw())
+            if not self._raw.add(payload):  # Minute is full, which only happens at very high rates
+                done.append(self._close_raw())
+                self._raw.add(payload)
+            self._prev_raw = mod_raw
+            self.week, self.leapS = week, leapS
+        elif msg_id == NavHPPOSLLH.id and self.leapS:
+            packet = NavHPPOSLLH(payload)
+            mod_pos = second_of_minute(packet.iTOW / 1000, self.leapS)
+            if mod_pos < self._prev_pos and len(self._pos):
+                done.append(self._close_pos())
+            if not self._pos.add(packet):
+                done.append(self._close_pos())
+                self._pos.add(packet)
+            self._prev_pos = mod_pos
+        return done
+
+    def flush(self):
+        """ Close the minutes that are not finished yet. """
+        done = []
+        if len(self._raw):
+            done.append(self._close_raw())
+        if len(self._pos) and self.week is not None:
+            done.append(self._close_pos())
+        return done
@@ -0,0 +1,95 @@
+from collections import deque
+from .api import raw_packet
+from .messages import RxmRawx, UnknownPacket
+
+
+class EncodedRawx:
+    """ Class for an RXM-RAWX epoch that was decoded and encoded for upload by a decode worker. It carries what the
+        reader loop needs to split minutes, and api.raw_packet copies its encoded bytes as they are. """
+    __slots__ = ('rcvTow', 'week', 'leapS', 'numMeas', 'encoded')
+
+    def __init__(self, rcvTow, week, leapS, numMeas, encoded):
+        self.rcvTow = rcvTow
+        self.week = week
+        self.leapS = leapS
+        self.numMeas = numMeas
+        self.encoded = encoded
+
+
+_msg_dict = {}  # Packet classes of a worker process, set by _init_worker
+
+
+def _init_worker(msg_dict):
+    global _msg_dict
+    _msg_dict = msg_dict
+
+
+def decode_frames(frames, msg_dict=None):
+    """ Decode a batch of (msg_id, payload) frames. RXM-RAWX frames become EncodedRawx, other frames are decoded
+        with msg_dict (the worker's if not given). Frames that cannot be decoded become UnknownPacket. """
+    msg_dict = _msg_dict if msg_dict is None else msg_dict
+    out = []
+    for msg_id, payload in frames:
+        try:
+            if msg_id == RxmRawx.id:
+                packet = RxmRawx(payload)
+                out.append(EncodedRawx(packet.rcvTow, packet.week, packet.leapS, packet.numMeas,
+                                       raw_packet([packet])))
+            else:
+                out.append(msg_dict[msg_id](payload))
+        except KeyError:  # Unknown message, or a field value the message has no name for, like UBXReader.decode
+            out.append(UnknownPacket(msg_id, payload))
+    return out
+
+
+class DecodePipeline:
+    """ Class for decoding framed packets in worker processes while the reader keeps reading.
+
+        Frames are collected into batches of batch frames, and each batch is decoded by a process of a pool of
+        workers. feed() returns the decoded packets of the batches that are done, in the order the frames were fed,
+        so a slow batch holds back the batches after it. At most max_pending batches are in the pool, after that
+        feed() waits for the oldest. With workers=0 frames are decoded in the calling process as they are fed,
+        through the same code. """
+    def __init__(self, msg_dict, workers=0, batch=16, max_pending=None):
+        self._msg_dict = msg_dict
+        self._workers = workers
+        self._batch_size = batch
+        self._max_pending = max_pending or 4 * max(workers, 1)
+        self._batch = []
+        self._pending = deque()  # Futures in the order the batches were made
+        self._pool = None
+        if workers:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(msg_dict,))
+
+    def feed(self, msg_id, payload):
+        """ Add a frame. Returns the list of packets decoded since the last call. """
+        if not self._pool:
+            return decode_frames([(msg_id, payload)], self._msg_dict)
+        self._batch.append((msg_id, bytes(payload)))
+        if len(self._batch) >= self._batch_size:
+            self._pending.append(self._pool.submit(decode_frames, self._batch))
+            self._batch = []
+        out = []
+        while self._pending and (self._pending[0].done() or len(self._pending) > self._max_pending):
+            out.extend(self._pending.popleft().result())
+        return out
+
+    def flush(self):
+        """ Decode everything fed so far and return the packets not returned yet. """
+        if self._batch:
+            self._pending.append(self._pool.submit(decode_frames, self._batch))
+            self._batch = []
+        out = []
+        while self._pending:
+            out.extend(self._pending.popleft().result())
+        return out
+
+    def close(self):
+        """ Shut the workers down. """
+        if self._pool:
+            self._pool.shutdown(cancel_futures=True)
+
+    @property
+    def workers(self):
+        return self._workers
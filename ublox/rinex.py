@@ -0,0 +1,325 @@
+import os
+import struct
+import argparse
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from .ublox_reader import split_frames
+from .messages import RxmRawx
+
+
+# RINEX 3 observation codes (band and attribute) for each (gnssId, sigId) of UBX-RXM-RAWX
+_SIGNALS = {
+    0: {0: '1C', 3: '2L', 4: '2S', 6: '5I', 7: '5Q'},             # GPS L1 C/A, L2 CL, L2 CM, L5 I, L5 Q
+    1: {0: '1C'},                                               # SBAS L1 C/A
+    2: {0: '1C', 1: '1B', 3: '5I', 4: '5Q', 5: '7I', 6: '7Q'},  # Galileo E1 C, E1 B, E5a I, E5a Q, E5b I, E5b Q
+    3: {0: '2I', 1: '2I', 2: '7I', 3: '7I', 7: '5P', 8: '5D'},  # BeiDou B1I D1/D2, B2I D1/D2, B2a pilot/data
+    6: {0: '1C', 2: '2C'},                                      # GLONASS L1 OF, L2 OF
+}
+_SYSTEMS = {0: 'G', 1: 'S', 2: 'E', 3: 'C', 6: 'R'}
+_OBS = 'CLDS'  # Pseudorange, carrier phase, doppler and signal strength for every signal
+
+_GPS_EPOCH = dt.datetime(1980, 1, 6)
+_BLANK = ' ' * 16
+_LLI = ' 123'  # Loss of lock indicator, blank when not set
+_GLO_LINES = 4  # Header lines reserved for GLONASS SLOT / FRQ #, 8 satellites per line
+_RAWX_ID = RxmRawx.id
+_RAWX_MEAS = struct.Struct('<ddfBBBBHBBBBBB')
+
+
+def _obs_types():
+    """ Dictionary of system letter to list of observation types, and of system letter to {code: column}. """
+    types, columns = {}, {}
+    for gnss, signals in _SIGNALS.items():
+        codes = list(dict.fromkeys(signals.values()))
+        sys = _SYSTEMS[gnss]
+        types[sys] = [o + c for c in codes for o in _OBS]
+        columns[sys] = {c: i for i, c in enumerate(codes)}
+    return types, columns
+
+
+_OBS_TYPES, _COLUMNS = _obs_types()
+# (gnssId, sigId) -> (system letter, index of the first field of the signal, number of fields of the system)
+_CODES = {(gnss, sig): (_SYSTEMS[gnss], 4 * _COLUMNS[_SYSTEMS[gnss]][code], len(_OBS_TYPES[_SYSTEMS[gnss]]))
+          for gnss, signals in _SIGNALS.items() for sig, code in signals.items()}
+_SSI = [str(min(max(i // 6, 1), 9)) for i in range(256)]  # Signal strength indicator of each C/N0 as in api
+_SV = [f'{i:02d}' for i in range(256)]
+
+
+def _header_line(text, label):
+    """ Header line with the label in columns 61-80. """
+    return f'{text:<60.60s}{label:<20s}\n'
+
+
+def _epoch_time(week, tow):
+    """ GPS calendar time of a week and time of week as a datetime and the fractional seconds. The time of week is
+        rounded to the 0.1 us resolution of RINEX first, so that rounding up carries into the whole seconds. """
+    whole, frac = divmod(round(tow * 10**7), 10**7)
+    return _GPS_EPOCH + dt.timedelta(weeks=week, seconds=whole), frac / 10**7
+
+
+def _glonass_lines(slots):
+    """ GLONASS SLOT / FRQ # lines for a dictionary of slot to frequency number, padded with comments to the reserved
+        number of lines. """
+    items = sorted(slots.items())
+    lines = []
+    for i in range(_GLO_LINES):
+        part = items[8 * i:8 * i + 8]
+        if part or i == 0:
+            text = (f'{len(items):3d} ' if i == 0 else '    ') + ''.join(f'R{s:02d} {f:2d} ' for s, f in part)
+            lines.append(_header_line(text, 'GLONASS SLOT / FRQ #'))
+        else:
+            lines.append(_header_line('', 'COMMENT'))
+    return ''.join(lines)
+
+
+def rawx_rows(payload):
+    """ Takes in a UBX-RXM-RAWX payload and returns (week, rcvTow, rows) with one tuple per measurement of
+        (prMeas, cpMeas, doMeas, gnssId, svId, sigId, freqId, locktime, cno, prStdev, cpStdev, doStdev, trkStat, _). """
+    tow, week, _, num = struct.unpack_from('<dHbB', payload)
+    return week, tow, list(_RAWX_MEAS.iter_unpack(payload[16:16 + 32 * num]))
+
+
+class RinexObsWriter:
+    """ Class for writing RxmRawx epochs as a RINEX 3.04 observation file.
+
+        Epochs are formatted and written one at a time to a file opened for text writing, so memory use does not grow
+        with the length of the file. The header is written with the first epoch. GLONASS frequency numbers are only
+        known once all epochs have been seen, so their header lines are rewritten by close() when the file is
+        seekable. """
+    def __init__(self, f, marker='UNKNOWN', observer='', agency='CCAR', receiver=('', 'UBLOX ZED-F9P', ''),
+                 antenna=('', ''), position=(0., 0., 0.), write_header=True):
+        self._f = f
+        self._marker = marker
+        self._observer = observer
+        self._agency = agency
+        self._receiver = receiver
+        self._antenna = antenna
+        self._position = position
+        self._header = not write_header
+        self._glo_offset = None
+        self._glonass = {}  # GLONASS slot -> frequency number
+        self._locktime = {}  # (gnssId, svId, sigId) -> locktime in the previous epoch
+        self._epochs = 0
+
+    def header(self, week, tow):
+        """ Header text for a file starting at the given GPS time. """
+        first, frac = _epoch_time(week, tow)
+        lines = [_header_line(f'{"3.04":>9s}{"":11s}{"OBSERVATION DATA":<20s}M', 'RINEX VERSION / TYPE'),
+                 _header_line(f'{"ublox":<20s}{self._agency:<20s}{dt.datetime.now(dt.timezone.utc):%Y%m%d %H%M%S} UTC',
+                              'PGM / RUN BY / DATE'),
+                 _header_line(self._marker, 'MARKER NAME'),
+                 _header_line('GEODETIC', 'MARKER TYPE'),
+                 _header_line(f'{self._observer:<20s}{self._agency:<40s}', 'OBSERVER / AGENCY'),
+                 _header_line(''.join(f'{i:<20s}' for i in self._receiver), 'REC # / TYPE / VERS'),
+                 _header_line(''.join(f'{i:<20s}' for i in self._antenna), 'ANT # / TYPE'),
+                 _header_line(''.join(f'{i:14.4f}' for i in self._position), 'APPROX POSITION XYZ'),
+                 _header_line(''.join(f'{0:14.4f}' for _ in range(3)), 'ANTENNA: DELTA H/E/N')]
+        for sys, types in _OBS_TYPES.items():
+            for i in range(0, len(types), 13):
+                text = f'{sys:1s}  {len(types):3d}' if i == 0 else ' ' * 6
+                text += ''.join(f' {t:3s}' for t in types[i:i + 13])
+                lines.append(_header_line(text, 'SYS / # / OBS TYPES'))
+        lines.append(_header_line(''.join(f'{i:6d}' for i in (first.year, first.month, first.day, first.hour,
+                                                               first.minute)) + f'{first.second + frac:13.7f}     GPS',
+                                  'TIME OF FIRST OBS'))
+        for sys, types in _OBS_TYPES.items():
+            for t in types:
+                if t[0] == 'L':
+                    lines.append(_header_line(f'{sys:1s} {t:3s}  0.00000', 'SYS / PHASE SHIFT'))
+        lines.append(_header_line(' C1C    0.000 C1P    0.000 C2C    0.000 C2P    0.000', 'GLONASS COD/PHS/BIS'))
+        return ''.join(lines)
+
+    def write_epoch(self, packet):
+        """ Write one RxmRawx packet. """
+        rows = [(m.prMeas, m.cpMeas, m.doMeas, m.gnssId, m.svId, m.sigId, m.freqId, m.locktime, m.cno, 0, 0, 0,
+                 m.prValid | m.cpValid << 1 | m.halfCyc << 2 | m.subHalfCyc << 3, 0) for m in packet.measurements]
+        self.write_rows(packet.week, packet.rcvTow, rows)
+
+    def write_payload(self, payload):
+        """ Write one UBX-RXM-RAWX payload without creating an RxmRawx packet. """
+        self.write_rows(*rawx_rows(payload))
+
+    def write_rows(self, week, tow, rows):
+        """ Write one epoch of measurement rows as returned by rawx_rows. """
+        f = self._f
+        if not self._header:
+            f.write(self.header(week, tow))
+            if f.seekable():
+                self._glo_offset = f.tell()
+            f.write(_glonass_lines({}))
+            f.write(_header_line('', 'END OF HEADER'))
+            self._header = True
+        prev = self._locktime
+        locktime = {}
+        sats = {}
+        glonass = self._glonass
+        for pr, cp, do, gnss, sv, sig, freq, lock, cno, _, _, _, trk, _ in rows:
+            code = _CODES.get((gnss, sig))
+            if code is None or sv == 255:  # Signal without an observation code or unknown GLONASS slot
+                continue
+            key = (gnss, sv, sig)
+            lli = 1 if lock < prev.get(key, 0x10000) else 0  # New signal or lock time reset
+            locktime[key] = lock
+            if not trk & 0x04:  # Half cycle not resolved
+                lli |= 2
+            if gnss == 6:
+                glonass[sv] = freq - 7
+            sat, i, n = code
+            sat += _SV[sv - 100 if gnss == 1 else sv]
+            fields = sats.get(sat)
+            if fields is None:
+                fields = sats[sat] = [_BLANK] * n
+            ssi = _SSI[cno]
+            if trk & 0x01:
+                fields[i] = '%14.3f %s' % (pr, ssi)
+            if trk & 0x02:
+                fields[i + 1] = '%14.3f%s%s' % (cp, _LLI[lli], ssi)
+            fields[i + 2] = '%14.3f %s' % (do, ssi)
+            fields[i + 3] = '%14.3f %s' % (cno, ssi)
+        self._locktime = locktime
+        epoch, frac = _epoch_time(week, tow)
+        lines = [f'> {epoch:%Y %m %d %H %M}{epoch.second + frac:11.7f}  0{len(sats):3d}\n']
+        for sat in sorted(sats):
+            lines.append(sat + ''.join(sats[sat]).rstrip() + '\n')
+        f.write(''.join(lines))
+        self._epochs += 1
+
+    def skip_rows(self, week, tow, rows):
+        """ Take the lock times of an epoch that is not written, so that the next epoch has correct loss of lock
+            indicators. """
+        self._locktime = {(r[3], r[4], r[5]): r[7] for r in rows}
+
+    def close(self):
+        """ Rewrite the GLONASS header lines if possible and flush the file. """
+        if self._glo_offset is not None and self._glonass:
+            end = self._f.tell()
+            self._f.seek(self._glo_offset)
+            self._f.write(_glonass_lines(self._glonass))
+            self._f.seek(end)
+        self._f.flush()
+
+    @property
+    def epochs(self):
+        return self._epochs
+
+    @property
+    def glonass(self):
+        return self._glonass
+
+
+_CHUNK = 1 << 22  # Bytes read from a capture file at a time
+_WARMUP = 1 << 16  # Bytes before a range read to find the lock times of the previous epoch
+
+
+def _rawx_payloads(path, start=0, stop=None):
+    """ Generator of (offset, payload) of the RAWX packets of a capture file that start in [start, stop). """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        buff = bytearray()
+        offset = start  # File offset of buff[0]
+        while True:
+            data = f.read(_CHUNK)
+            buff += data
+            frames, pos = split_frames(buff)
+            for i, msg_id, payload in frames:
+                if stop is not None and offset + i >= stop:
+                    return
+                if msg_id == _RAWX_ID:
+                    yield offset + i, payload
+            if not data:
+                return
+            del buff[:pos]
+            offset += pos
+
+
+def _convert_range(path, dst, start, stop, header):
+    """ Convert the RAWX packets starting in [start, stop) of a capture file to RINEX epochs without a header.
+        Returns the first (week, rcvTow) and the GLONASS frequency numbers seen. """
+    with open(dst, 'w', buffering=1 << 20) as f:
+        writer = RinexObsWriter(f, write_header=False, **header)
+        first = None
+        for offset, payload in _rawx_payloads(path, max(start - _WARMUP, 0), stop):
+            week, tow, rows = rawx_rows(payload)
+            if offset < start:  # Epoch belongs to the previous range
+                writer.skip_rows(week, tow, rows)
+                continue
+            if first is None:
+                first = (week, tow)
+            writer.write_rows(week, tow, rows)
+    return first, writer.glonass
+
+
+def convert(src, dst, workers=1, **header):
+    """ Convert a UBX capture file to a RINEX 3 observation file. Keyword arguments are passed to RinexObsWriter.
+
+        With more than one worker the capture file is split into byte ranges that are converted in parallel to
+        temporary files next to dst, which are then joined after the header. Returns the number of epochs written
+        when converted by a single worker and None otherwise. """
+    if workers <= 1:
+        with open(dst, 'w', buffering=1 << 20) as f:
+            writer = RinexObsWriter(f, **header)
+            for _, payload in _rawx_payloads(src):
+                writer.write_payload(payload)
+            writer.close()
+        return writer.epochs
+
+    size = os.path.getsize(src)
+    bounds = [size * i // (4 * workers) for i in range(4 * workers + 1)]
+    parts = [f'{dst}.part{i}' for i in range(len(bounds) - 1)]
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_convert_range, [src] * len(parts), parts, bounds[:-1], bounds[1:],
+                                    [header] * len(parts)))
+        firsts = [i[0] for i in results if i[0] is not None]
+        glonass = {}
+        for _, i in results:
+            glonass.update(i)
+        with open(dst, 'w', buffering=1 << 20) as f:
+            if firsts:
+                f.write(RinexObsWriter(f, **header).header(*firsts[0]))
+                f.write(_glonass_lines(glonass))
+                f.write(_header_line('', 'END OF HEADER'))
+            for part in parts:
+                with open(part, 'r') as p:
+                    while True:
+                        data = p.read(_CHUNK)
+                        if not data:
+                            break
+                        f.write(data)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def _convert_one(args):
+    """ Convert one file for convert_many. """
+    src, dst, header = args
+    return convert(src, dst, **header)
+
+
+def convert_many(srcs, out_dir, workers=None, **header):
+    """ Convert many UBX capture files to RINEX observation files in out_dir, one file per process. Returns the list
+        of output file names. """
+    os.makedirs(out_dir, exist_ok=True)
+    dsts = [os.path.join(out_dir, os.path.splitext(os.path.basename(i))[0] + '.rnx') for i in srcs]
+    with ProcessPoolExecutor(workers) as pool:
+        list(pool.map(_convert_one, [(s, d, header) for s, d in zip(srcs, dsts)]))
+    return dsts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert UBX capture files to RINEX 3 observation files.')
+    parser.add_argument('files', nargs='+', help='UBX capture files')
+    parser.add_argument('-o', '--output', type=str, default='.', help='Output directory. Default is "."')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes. Default is the number of CPUs.')
+    parser.add_argument('-m', '--marker', type=str, default='UNKNOWN', help='Marker name. Default is "UNKNOWN"')
+    args = parser.parse_args()
+
+    if len(args.files) == 1:  # Split the one file across the workers
+        os.makedirs(args.output, exist_ok=True)
+        dst = os.path.join(args.output, os.path.splitext(os.path.basename(args.files[0]))[0] + '.rnx')
+        convert(args.files[0], dst, workers=args.jobs, marker=args.marker)
+    else:
+        convert_many(args.files, args.output, workers=args.jobs, marker=args.marker)
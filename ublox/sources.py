@@ -0,0 +1,328 @@
+import time
+import struct
+import select
+import socket
+import socketserver
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from .ublox_reader import split_frames
+from .messages import RxmRawx
+
+
+class ByteSource(ABC):
+    """ Byte source for inheritance.
+
+        Subclasses implement non-blocking bulk reads (_read_available) and waiting for data (_wait). Blocking reads of
+        a given size, as done by UBXReader on a serial port, are built on top of those. """
+    timeout = 5  # Seconds a blocking read waits for data
+
+    def __init__(self):
+        self._pending = bytearray()
+
+    @abstractmethod
+    def _read_available(self, max_bytes):
+        """ Return up to max_bytes that can be read without blocking, or b'' if there are none. """
+        pass
+
+    @abstractmethod
+    def _wait(self, timeout):
+        """ Wait up to timeout seconds for data. Returns True if data may be available. """
+        pass
+
+    def read_available(self, max_bytes=65536):
+        """ Read up to max_bytes without blocking. Returns b'' if no data is available. """
+        if self._pending:
+            data = bytes(self._pending[:max_bytes])
+            del self._pending[:max_bytes]
+            return data
+        return self._read_available(max_bytes)
+
+    def wait(self, timeout=None):
+        """ Wait up to timeout seconds for data. Returns True if data may be available. """
+        return bool(self._pending) or self._wait(timeout)
+
+    def read(self, n=1):
+        """ Read n bytes, blocking for at most timeout seconds for each piece. Returns fewer bytes on timeout. """
+        while len(self._pending) < n:
+            data = self._read_available(max(n - len(self._pending), 65536))
+            if data:
+                self._pending += data
+            elif not self._wait(self.timeout):
+                break
+        data = bytes(self._pending[:n])
+        del self._pending[:n]
+        return data
+
+    def write(self, data):
+        """ Write to the device. Sources that cannot be written to discard the data. """
+        return len(data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SerialSource(ByteSource):
+    """ Serial port source. """
+    def __init__(self, port, baudrate=38400, timeout=5):
+        super().__init__()
+        import serial
+        self._dev = serial.Serial(port,
+                                  timeout=timeout,
+                                  baudrate=baudrate,
+                                  parity=serial.PARITY_NONE,
+                                  stopbits=serial.STOPBITS_ONE,
+                                  bytesize=serial.EIGHTBITS)
+        self.timeout = timeout
+
+    def _read_available(self, max_bytes):
+        n = min(self._dev.in_waiting, max_bytes)
+        return self._dev.read(n) if n else b''
+
+    def _wait(self, timeout):
+        return bool(select.select([self._dev.fileno()], [], [], timeout)[0])
+
+    def write(self, data):
+        return self._dev.write(data)
+
+    def close(self):
+        self._dev.close()
+
+    @property
+    def baudrate(self):
+        return self._dev.baudrate
+
+    @baudrate.setter
+    def baudrate(self, value):
+        self._dev.baudrate = value
+
+
+class _SocketSource(ByteSource):
+    """ Stream socket source for inheritance. The connection is opened again when it is closed by the other end. """
+    def __init__(self, family, address, retry=1.):
+        super().__init__()
+        self._family = family
+        self._address = address
+        self._retry = retry
+        self._sock = None
+        self._connect()
+
+    def _connect(self):
+        """ Open the connection. """
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        sock.connect(self._address)
+        sock.setblocking(False)
+        self._sock = sock
+
+    def _reconnect(self):
+        """ Try to open the connection again after a lost connection. """
+        try:
+            self._connect()
+        except OSError:
+            time.sleep(self._retry)
+
+    def _read_available(self, max_bytes):
+        if self._sock is None:
+            return b''
+        try:
+            data = self._sock.recv(max_bytes)
+        except (BlockingIOError, InterruptedError):
+            return b''
+        except OSError:
+            data = b''
+        if not data:  # Connection closed
+            self._sock.close()
+            self._sock = None
+        return data
+
+    def _wait(self, timeout):
+        if self._sock is None:
+            self._reconnect()
+            return self._sock is not None
+        return bool(select.select([self._sock], [], [], timeout)[0])
+
+    def write(self, data):
+        if self._sock is None:
+            return 0
+        self._sock.setblocking(True)
+        try:
+            self._sock.sendall(data)
+        finally:
+            self._sock.setblocking(False)
+        return len(data)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class TcpSource(_SocketSource):
+    """ TCP client source, for example for a receiver served by ser2net. """
+    def __init__(self, host, port, retry=1.):
+        super().__init__(socket.AF_INET, (host, port), retry)
+
+
+class UnixSource(_SocketSource):
+    """ Unix domain socket source. """
+    def __init__(self, path, retry=1.):
+        super().__init__(socket.AF_UNIX, path, retry)
+
+
+class FileSource(ByteSource):
+    """ Source that reads a capture file as fast as it is asked to. Raises EOFError at the end of the file. """
+    def __init__(self, path):
+        super().__init__()
+        self._f = open(path, 'rb')
+
+    def _read_available(self, max_bytes):
+        data = self._f.read(max_bytes)
+        if not data:
+            raise EOFError(self._f.name)
+        return data
+
+    def _wait(self, timeout):
+        return True
+
+    def close(self):
+        self._f.close()
+
+
+class ReplaySource(ByteSource):
+    """ Source that plays a capture file back at the rate it was recorded, or speed times faster.
+
+        Timing comes from the receiver time of week of the RXM-RAWX packets in the file, every other packet is
+        released together with the RAWX packet before it. A speed of 0 replays as fast as possible. Raises EOFError
+        at the end of the file. """
+    _CHUNK = 1 << 16
+
+    def __init__(self, path, speed=1.):
+        super().__init__()
+        self._f = open(path, 'rb')
+        self._speed = speed
+        self._buff = bytearray()
+        self._queue = deque()  # (due time, bytes) of framed packets not yet released
+        self._start = None  # (wall clock, rcvTow) of the first RAWX packet
+        self._tow = None
+        self._due = 0.
+        self._eof = False
+
+    def _fill(self):
+        """ Frame the next chunk of the file. """
+        data = self._f.read(self._CHUNK)
+        if not data:
+            self._eof = True
+            return
+        buff = self._buff
+        buff += data
+        frames, pos = split_frames(buff)
+        for i, msg_id, payload in frames:
+            if msg_id == RxmRawx.id and self._speed:
+                tow = struct.unpack_from('<d', payload)[0]
+                if self._tow is not None and tow < self._tow - 302400:  # New week
+                    tow += 604800 * round((self._tow - tow) / 604800)
+                self._tow = tow
+                if self._start is None:
+                    self._start = (time.monotonic(), tow)
+                self._due = self._start[0] + (tow - self._start[1]) / self._speed
+            self._queue.append((self._due, bytes(buff[i:i + 8 + len(payload)])))
+        del buff[:pos]
+
+    def _read_available(self, max_bytes):
+        while not self._queue:
+            if self._eof:
+                raise EOFError(self._f.name)
+            self._fill()
+        now = time.monotonic()
+        out = []
+        size = 0
+        while self._queue and self._queue[0][0] <= now and size < max_bytes:
+            data = self._queue.popleft()[1]
+            out.append(data)
+            size += len(data)
+        return b''.join(out)
+
+    def _wait(self, timeout):
+        while not self._queue and not self._eof:
+            self._fill()
+        if not self._queue:
+            return True  # So the next read raises EOFError
+        delay = self._queue[0][0] - time.monotonic()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def close(self):
+        self._f.close()
+
+
+class _ReplayTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ReplayServer:
+    """ TCP server that plays a capture file back to every client that connects, standing in for a remote receiver.
+        Writes from clients are discarded. """
+    def __init__(self, path, host='127.0.0.1', port=0, speed=1.):
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with ReplaySource(path, speed) as src:
+                    try:
+                        while True:
+                            src.wait(1.)
+                            data = src.read_available()
+                            if data:
+                                self.request.sendall(data)
+                    except (EOFError, OSError):
+                        pass
+
+        self._server = _ReplayTCPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        """ Start serving in a background thread. """
+        self._thread.start()
+        return self
+
+    def close(self):
+        """ Stop serving. """
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+
+def open_source(spec, baudrate=38400, timeout=5):
+    """ Open a byte source from a URL like specification:
+            serial:///dev/ttyS0?baudrate=38400  Serial port (a bare /dev/ path also works)
+            tcp://host:port                     TCP client
+            unix:///path/to/socket              Unix domain socket
+            file:///path/to/capture.ubx         Capture file, as fast as it is read
+            replay:///path/to/capture.ubx?speed=10  Capture file at the recorded rate times speed """
+    url = urlsplit(spec)
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    scheme = url.scheme or ('serial' if spec.startswith('/dev/') else 'file')
+    if scheme == 'serial':
+        return SerialSource(url.path, int(query.get('baudrate', baudrate)), float(query.get('timeout', timeout)))
+    elif scheme == 'tcp':
+        return TcpSource(url.hostname, url.port)
+    elif scheme == 'unix':
+        return UnixSource(url.path)
+    elif scheme == 'file':
+        return FileSource(url.path)
+    elif scheme == 'replay':
+        return ReplaySource(url.path, float(query.get('speed', 1.)))
+    raise ValueError(f"'{spec}' is not a valid source")
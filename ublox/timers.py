@@ -0,0 +1,145 @@
+import time
+import heapq
+import logging
+import threading
+from itertools import count
+
+
+class Timer:
+    """ Class for a callback scheduled on a TimerWheel. """
+    __slots__ = ('due', 'interval', 'callback', 'name', 'cancelled')
+
+    def __init__(self, due, interval, callback, name):
+        self.due = due
+        self.interval = interval  # None for a one shot timer
+        self.callback = callback
+        self.name = name
+        self.cancelled = False
+
+    def cancel(self):
+        """ Stop the timer. A callback that is already running finishes. """
+        self.cancelled = True
+
+
+class TimerWheel:
+    """ Class for running timed callbacks in one thread next to the reader.
+
+        Times come from the monotonic clock, so changes of the system clock do not move timers. The thread sleeps
+        until the next timer is due, it does not poll. Only a handful of timers run, so they are kept in a heap.
+        Repeating timers keep their phase: a timer that runs late is due again one interval after its due time, or
+        one interval from now if it missed whole intervals. Exceptions raised by callbacks are logged and the timer
+        keeps running. Callbacks run in the timer thread and should be short, slow work belongs in its own thread. """
+    def __init__(self):
+        self._heap = []
+        self._order = count()  # Breaks ties between timers due at the same time
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def _add(self, delay, interval, callback, name):
+        timer = Timer(time.monotonic() + delay, interval, callback, name or getattr(callback, '__name__', 'timer'))
+        with self._cond:
+            heapq.heappush(self._heap, (timer.due, next(self._order), timer))
+            self._cond.notify()
+        return timer
+
+    def every(self, interval, callback, name=None, delay=None):
+        """ Call callback every interval seconds, the first time after delay (default interval) seconds. """
+        return self._add(interval if delay is None else delay, interval, callback, name)
+
+    def after(self, delay, callback, name=None):
+        """ Call callback once after delay seconds. """
+        return self._add(delay, None, callback, name)
+
+    def start(self):
+        """ Start the timer thread. """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='timers', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """ Stop the timer thread. Timers that are due are not run. """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """ Timer loop. """
+        while True:
+            with self._cond:
+                while self._running:
+                    if self._heap:
+                        delay = self._heap[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+                _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback()
+            except Exception:
+                logging.exception(f'Timer {timer.name} failed')
+            if timer.interval is not None and not timer.cancelled:
+                now = time.monotonic()
+                timer.due += timer.interval
+                if timer.due <= now:  # Missed whole intervals, do not run them all at once
+                    timer.due = now + timer.interval
+                with self._cond:
+                    heapq.heappush(self._heap, (timer.due, next(self._order), timer))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class Heartbeat:
+    """ Class for telling a stalled reader from a running one.
+
+        The reader calls beat() for every packet, which only increments a counter. check() is meant to be called
+        from a timer: when the counter has not moved for timeout seconds the reader is stalled, which is logged once
+        and passed to on_stall with the seconds since the last beat. Recovery is logged too. """
+    def __init__(self, timeout=10., on_stall=None, name='Reader'):
+        self._timeout = timeout
+        self._on_stall = on_stall
+        self._name = name
+        self.count = 0
+        self._seen = 0
+        self._last = time.monotonic()  # Time the counter was last seen moving
+        self._stalled = False
+
+    def beat(self):
+        """ Record progress. """
+        self.count += 1
+
+    def check(self):
+        """ Check for progress since the last check. Returns True if the reader is alive. """
+        now = time.monotonic()
+        current = self.count
+        if current != self._seen:
+            self._seen = current
+            self._last = now
+            if self._stalled:
+                self._stalled = False
+                logging.info(f'{self._name} running again')
+            return True
+        idle = now - self._last
+        if idle >= self._timeout and not self._stalled:
+            self._stalled = True
+            logging.warning(f'{self._name} stalled, no packets for {idle:.0f} s')
+            if self._on_stall:
+                self._on_stall(idle)
+        return not self._stalled
+
+    @property
+    def stalled(self):
+        return self._stalled
@@ -0,0 +1,191 @@
+import bisect
+from dataclasses import dataclass
+import numpy as np
+
+
+# Event kinds emitted by TrackingTable.update
+ACQUIRED = 'acquired'
+SLIP = 'slip'
+HALF_CYCLE = 'half_cycle'
+LOST = 'lost'
+
+
+@dataclass(frozen=True)
+class ArcStats:
+    """ Dataclass for statistics of a continuous carrier phase arc of one signal. """
+    key: tuple
+    startWeek: int
+    startTow: float
+    endTow: float
+    epochs: int
+    cnoMean: float
+    cnoMin: int
+    cnoMax: int
+    maxLocktime: int
+
+
+@dataclass(frozen=True)
+class TrackingEvent:
+    """ Dataclass for a tracking state change of one signal. """
+    kind: str
+    key: tuple
+    week: int
+    rcvTow: float
+    arc: ArcStats = None
+
+
+class TrackingTable:
+    """ Class for tracking signals across RxmRawx epochs.
+
+        Signals are keyed by (gnssId, svId, sigId) and stored in preallocated arrays. A signal that is lost frees its
+        slot for the next acquired signal, so the table only grows when more signals are tracked at once than it has
+        slots for. """
+    def __init__(self, capacity=128):
+        self._slots = {}  # (gnssId, svId, sigId) -> slot
+        self._free = []  # Free slots, popped from the end
+        self._order = []  # Sorted list of (key, slot) for tracked signals
+        self._epoch = 0
+        self._week = 0
+        self._rcvTow = 0.
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        """ Allocate (or grow) the per-slot arrays to a given capacity. """
+        old = getattr(self, '_capacity', 0)
+        self._capacity = capacity
+        fields = {'_gnssId': np.uint8, '_svId': np.uint8, '_sigId': np.uint8, '_lastSeen': np.int64,
+                  '_locktime': np.uint16, '_halfCyc': np.bool_, '_cno': np.uint8, '_startWeek': np.uint16,
+                  '_startTow': np.float64, '_lastTow': np.float64, '_epochs': np.int64, '_cnoSum': np.float64,
+                  '_cnoMin': np.uint8, '_cnoMax': np.uint8, '_maxLocktime': np.uint16, '_slips': np.int64}
+        for name, dtype in fields.items():
+            arr = np.zeros(capacity, dtype=dtype)
+            if old:
+                arr[:old] = getattr(self, name)
+            setattr(self, name, arr)
+        self._free[:0] = range(capacity - 1, old - 1, -1)
+
+    def update(self, packet):
+        """ Update the table with one RxmRawx epoch and return the list of tracking events it caused. """
+        self._epoch += 1
+        self._week = week = packet.week
+        self._rcvTow = tow = packet.rcvTow
+        epoch = self._epoch
+        events = []
+        for m in packet.measurements:
+            key = (m.gnssId, m.svId, m.sigId)
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._acquire(key, m, week, tow)
+                events.append(TrackingEvent(ACQUIRED, key, week, tow))
+                continue
+            if self._lastSeen[slot] == epoch:  # Duplicate measurement of a signal within one epoch
+                continue
+            if m.locktime < self._locktime[slot]:  # Lock time reset means the carrier phase arc is broken
+                events.append(TrackingEvent(SLIP, key, week, tow, self._arc(slot)))
+                self._slips[slot] += 1
+                self._start_arc(slot, m, week, tow)
+            elif m.halfCyc != self._halfCyc[slot]:
+                events.append(TrackingEvent(HALF_CYCLE, key, week, tow))
+            self._observe(slot, m, epoch, tow)
+
+        # Signals that were tracked but not in this epoch have lost lock
+        n = len(self._order)
+        if n:
+            slots = np.fromiter((s for _, s in self._order), dtype=np.int64, count=n)
+            for slot in slots[self._lastSeen[slots] != epoch]:
+                key = (int(self._gnssId[slot]), int(self._svId[slot]), int(self._sigId[slot]))
+                events.append(TrackingEvent(LOST, key, week, tow, self._arc(slot)))
+                self._release(key, int(slot))
+        return events
+
+    def _acquire(self, key, m, week, tow):
+        """ Assign a free slot to a newly tracked signal. """
+        if not self._free:
+            self._alloc(2 * self._capacity)
+        slot = self._free.pop()
+        self._slots[key] = slot
+        bisect.insort(self._order, (key, slot))
+        self._gnssId[slot], self._svId[slot], self._sigId[slot] = key
+        self._slips[slot] = 0
+        self._start_arc(slot, m, week, tow)
+        self._observe(slot, m, self._epoch, tow)
+        return slot
+
+    def _release(self, key, slot):
+        """ Return the slot of a lost signal to the free list. """
+        del self._slots[key]
+        del self._order[bisect.bisect_left(self._order, (key, slot))]
+        self._free.append(slot)
+
+    def _start_arc(self, slot, m, week, tow):
+        """ Reset the arc statistics of a slot. """
+        self._startWeek[slot] = week
+        self._startTow[slot] = tow
+        self._epochs[slot] = 0
+        self._cnoSum[slot] = 0.
+        self._cnoMin[slot] = m.cno
+        self._cnoMax[slot] = m.cno
+        self._maxLocktime[slot] = 0
+
+    def _observe(self, slot, m, epoch, tow):
+        """ Store one measurement of a signal. """
+        self._lastSeen[slot] = epoch
+        self._lastTow[slot] = tow
+        self._locktime[slot] = m.locktime
+        self._halfCyc[slot] = m.halfCyc
+        self._cno[slot] = m.cno
+        self._epochs[slot] += 1
+        self._cnoSum[slot] += m.cno
+        if m.cno < self._cnoMin[slot]:
+            self._cnoMin[slot] = m.cno
+        if m.cno > self._cnoMax[slot]:
+            self._cnoMax[slot] = m.cno
+        if m.locktime > self._maxLocktime[slot]:
+            self._maxLocktime[slot] = m.locktime
+
+    def _arc(self, slot):
+        """ Statistics of the current arc of a slot. """
+        epochs = int(self._epochs[slot])
+        return ArcStats((int(self._gnssId[slot]), int(self._svId[slot]), int(self._sigId[slot])),
+                        int(self._startWeek[slot]), float(self._startTow[slot]), float(self._lastTow[slot]), epochs,
+                        float(self._cnoSum[slot]) / epochs if epochs else 0., int(self._cnoMin[slot]),
+                        int(self._cnoMax[slot]), int(self._maxLocktime[slot]))
+
+    def arc(self, key):
+        """ Statistics of the current arc of a tracked signal. Raises KeyError if the signal is not tracked. """
+        return self._arc(self._slots[tuple(key)])
+
+    def slips(self, key):
+        """ Number of cycle slips of a tracked signal since it was acquired. """
+        return int(self._slips[self._slots[tuple(key)]])
+
+    def snapshot(self):
+        """ Current visible constellation as a dictionary of arrays ordered by (gnssId, svId, sigId). """
+        slots = np.fromiter((s for _, s in self._order), dtype=np.int64, count=len(self._order))
+        return {'gnssId': self._gnssId[slots],
+                'svId': self._svId[slots],
+                'sigId': self._sigId[slots],
+                'cno': self._cno[slots],
+                'locktime': self._locktime[slots],
+                'halfCyc': self._halfCyc[slots],
+                'arcStartTow': self._startTow[slots],
+                'arcEpochs': self._epochs[slots],
+                'slips': self._slips[slots]}
+
+    def __contains__(self, key):
+        return tuple(key) in self._slots
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def week(self):
+        return self._week
+
+    @property
+    def rcvTow(self):
+        return self._rcvTow
@@ -1,18 +1,85 @@
 import struct
+from collections import deque
+from itertools import accumulate
 from .messages import UnknownPacket
 
 
+MAX_PAYLOAD = 16384  # Longest payload accepted by the framer, longer lengths are treated as false syncs
+
+
+def fletcher(buff):
+    """ Returns the 8-bit Fletcher checksum (ck_a, ck_b) of a buffer. """
+    return sum(buff) & 0xff, sum(accumulate(buff)) & 0xff
+
+
+def split_frames(data, pos=0, end=None):
+    """ Takes in a buffer of bytes and returns the list of (offset, msg_id, payload) of the valid packets in it, and
+        the offset to resume from once more bytes are available. """
+    end = len(data) if end is None else end
+    find = data.find
+    frames = []
+    while True:
+        i = find(b'\xb5\x62', pos, end)
+        if i < 0:
+            return frames, end - 1 if end > pos and data[end - 1] == 0xb5 else end
+        if i + 8 > end:
+            return frames, i
+        msg_id, length = struct.unpack_from('<HH', data, i + 2)
+        stop = i + 8 + length
+        if length > MAX_PAYLOAD:
+            pos = i + 1
+            continue
+        if stop > end:
+            return frames, i
+        body = bytes(data[i + 2:stop - 2])
+        if fletcher(body) == (data[stop - 2], data[stop - 1]):
+            frames.append((i, msg_id, body[4:]))
+            pos = stop
+        else:
+            pos = i + 1
+
+
+class UBXFramer:
+    """ Class for splitting a stream of bytes that arrives in arbitrary pieces into packets. """
+    def __init__(self):
+        self._buff = bytearray()
+
+    def feed(self, data):
+        """ Add bytes to the stream and return the list of (msg_id, payload) packets completed by them. """
+        buff = self._buff
+        buff += data
+        frames, pos = split_frames(buff)
+        del buff[:pos]
+        return [(msg_id, payload) for _, msg_id, payload in frames]
+
+    def __len__(self):
+        return len(self._buff)
+
+
 class UBXReader:
-    """ Class for reading packet from GPS. """
+    """ Class for reading packet from GPS.
+
+        Devices with non-blocking bulk reads (read_available and wait, as the sources in ublox.sources have) are
+        drained in bulk through a UBXFramer, other devices are read a byte at a time. """
     def __init__(self, dev, msg_dict):
         self._dev = dev  #Device
         self._sync1 = b'\xb5'  # First synchronization byte
         self._sync2 = b'\x62'  # Second synchronization byte
         self._msg_dict = msg_dict
+        self._bulk = hasattr(dev, 'read_available')
+        self._framer = UBXFramer()
+        self._frames = deque()
 
     def read_packet(self):
         """ Public read packet function. """
-        msg_id, payload = self._read_packet()
+        return self.decode(*self._read_packet())
+
+    def read_frame(self):
+        """ Read the next packet without decoding it. Returns (msg_id, payload). """
+        return self._read_packet()
+
+    def decode(self, msg_id, payload):
+        """ Decode a packet read by read_frame. """
         try:
             return self._msg_dict[msg_id](payload)
         except KeyError:
@@ -20,6 +87,15 @@ class UBXReader:
 
     def _read_packet(self):
         """ Private read packet function. """
+        if self._bulk:
+            while not self._frames:
+                data = self._dev.read_available()
+                if data:
+                    self._frames.extend(self._framer.feed(data))
+                else:
+                    self._dev.wait(1.)
+            return self._frames.popleft()
+
         count = 0   # This is used to read more bits incremented by one each time the sync bits are found but the check
                     # sums do not work properly. This will fix an infinite loop in the rare case that the sync bits are
                     # found an even number of bits away from each other but not on purpose.
@@ -0,0 +1,231 @@
+import time
+import logging
+import threading
+from bisect import bisect_right
+from collections import deque
+from .api import save_to_dc, send
+
+
+class _Entry:
+    """ Minute of data waiting to be uploaded. """
+    __slots__ = ('t', 'data', 'offsets', 'pos', 'cache_key', 'done', 'spooled')
+
+    def __init__(self, t, data, offsets, cache_key=None, done=None):
+        self.t = t
+        self.data = memoryview(data)
+        self.offsets = offsets  # Offsets of the records, the data is only ever split between records
+        self.pos = 0  # Offset of the first byte not sent yet
+        self.cache_key = cache_key  # Key of the data in the spool if it came from there
+        self.done = done  # Called once the data has been sent or saved to the spool
+        self.spooled = False  # Set when stop() has saved what was left to the spool
+
+    @property
+    def remaining(self):
+        return len(self.data) - self.pos
+
+
+class AdaptiveUploader:
+    """ Class for uploading minutes of data to one endpoint in batches sized to the measured link.
+
+        Every POST carries whole records (epochs of a raw packet, or position packets), either the front part of a
+        minute or several minutes back to back. Each record carries its own time, so the server can recover the
+        minute boundaries. After a POST the batch size is doubled if it was answered in less than half of
+        target_latency and halved if it took longer than target_latency or failed, between min_bytes and max_bytes.
+        Failed POSTs are retried with exponential backoff. Minutes that do not fit under max_inflight bytes are
+        saved to the spool, and the spool is drained once everything in memory has been sent. """
+    def __init__(self, url, key, cache, split, min_bytes=2048, max_bytes=4 << 20, start_bytes=None,
+                 max_inflight=16 << 20, target_latency=5., max_backoff=60.):
+        self._url = url
+        self._key = key
+        self._cache = cache
+        self._split = split
+        self._min_bytes = min_bytes
+        self._max_bytes = max_bytes
+        self._batch = min(start_bytes or min_bytes * 16, max_bytes)
+        self._max_inflight = max_inflight
+        self._target_latency = target_latency
+        self._max_backoff = max_backoff
+        self._backoff = 0.
+        self._queue = deque()
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._posts = 0
+        self._failures = 0
+        self._sent = 0
+        self._spooled = 0
+        self._goodput = None  # Bytes per second, exponentially weighted
+        self._latency = None  # Seconds, exponentially weighted
+        self._decisions = deque(maxlen=100)
+
+    def start(self):
+        """ Start the upload thread. """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """ Stop the upload thread and save everything not uploaded to the spool. By default this waits for a POST
+            in progress, which times out after about 4 * target_latency. With a shorter timeout, the data of a POST
+            that is still running is spooled, and it may also reach the server. """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._cond:
+            while self._queue:
+                self._spool(self._queue.popleft())
+
+    def submit(self, t, data, done=None):
+        """ Queue a minute of data. If it does not fit under the in-flight limit it goes to the spool. done is called
+            once the data is no longer needed, so its buffer can be reused. """
+        with self._cond:
+            if self._queued + len(data) > self._max_inflight:
+                save_to_dc(self._cache, t, bytes(data))
+                self._spooled += len(data)
+                logging.warning('Upload backlog full. Data saved to cache. ')
+                if done:
+                    done()
+                return
+            self._queue.append(_Entry(t, data, self._split(data), done=done))
+            self._queued += len(data)
+            self._cond.notify()
+
+    def _spool(self, entry):
+        """ Save what is left of a queued minute to the spool. """
+        self._queued -= entry.remaining
+        entry.spooled = True
+        if entry.cache_key is None:
+            save_to_dc(self._cache, entry.t, bytes(entry.data[entry.pos:]))
+            self._spooled += entry.remaining
+        self._finish(entry)
+
+    @staticmethod
+    def _finish(entry):
+        """ Let go of the data of an entry. """
+        entry.data.release()
+        if entry.done:
+            entry.done()
+
+    def _from_spool(self):
+        """ Queue the oldest minute in the spool. It stays in the spool until it has been sent. """
+        for key in self._cache:
+            try:
+                data = self._cache[key]
+            except KeyError:
+                continue
+            try:
+                offsets = self._split(data)
+            except Exception:  # A corrupt entry would be retried forever and hold back the rest of the spool
+                logging.exception(f'Dropping unreadable cache entry {key} of {self._url}')
+                self._cache.pop(key, None)
+                continue
+            self._queue.append(_Entry(key, data, offsets, key))
+            self._queued += len(data)
+            return True
+        return False
+
+    def _batch_pieces(self):
+        """ Choose the data for the next POST. Returns the list of (entry, end offset) to send. """
+        budget = self._batch
+        pieces = []
+        for entry in self._queue:
+            if entry.remaining <= budget:
+                pieces.append((entry, len(entry.data)))
+                budget -= entry.remaining
+                continue
+            # Cut the minute at the last record boundary that fits, sending at least one record
+            i = bisect_right(entry.offsets, entry.pos + budget) - 1
+            end = entry.offsets[i] if i >= 0 and entry.offsets[i] > entry.pos else None
+            if end is None and not pieces:
+                j = bisect_right(entry.offsets, entry.pos)
+                end = entry.offsets[j] if j < len(entry.offsets) else len(entry.data)
+            if end is not None:
+                pieces.append((entry, end))
+            break
+        return pieces
+
+    def _run(self):
+        """ Upload loop. Unexpected errors are logged and backed off from like a failed POST, so they do not end
+            the thread. """
+        while self._running:
+            try:
+                ok = self._upload()
+            except Exception:
+                logging.exception(f'Upload to {self._url} failed')
+                with self._cond:
+                    self._adapt(False, 0, 0.)
+                ok = False
+            if not ok:
+                with self._cond:  # Back off, but stop() ends the wait
+                    self._cond.wait_for(lambda: not self._running, self._backoff)
+
+    def _upload(self):
+        """ Send the next batch, waiting for data if there is none. Returns False if the POST failed. """
+        with self._cond:
+            while self._running and not self._queue and not self._from_spool():
+                self._cond.wait(self._target_latency)
+            if not self._running:
+                return True
+            pieces = self._batch_pieces()
+            data = b''.join(entry.data[entry.pos:end] for entry, end in pieces)
+        start = time.monotonic()
+        label = 'Old ' if any(entry.cache_key is not None for entry, _ in pieces) else 'New '
+        ok = send(self._url, self._key, data, label, timeout=4 * self._target_latency)
+        latency = time.monotonic() - start
+        with self._cond:
+            self._posts += 1
+            if ok:
+                for entry, end in pieces:
+                    if entry.spooled:  # stop() gave up waiting for this POST
+                        continue
+                    self._queued -= end - entry.pos
+                    entry.pos = end
+                while self._queue and not self._queue[0].remaining:
+                    done = self._queue.popleft()
+                    if done.cache_key is not None:
+                        self._cache.pop(done.cache_key, None)
+                    self._finish(done)
+            self._adapt(ok, len(data), latency)
+        return ok
+
+    def _adapt(self, ok, size, latency):
+        """ Change the batch size after a POST. """
+        old = self._batch
+        if ok:
+            self._sent += size
+            self._backoff = 0.
+            rate = size / latency if latency > 0 else 0.
+            self._goodput = rate if self._goodput is None else 0.8 * self._goodput + 0.2 * rate
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            if latency < self._target_latency / 2 and size >= self._batch / 2:
+                self._batch = min(2 * self._batch, self._max_bytes)
+            elif latency > self._target_latency:
+                self._batch = max(self._batch // 2, self._min_bytes)
+        else:
+            self._failures += 1
+            self._backoff = min(max(2 * self._backoff, 1.), self._max_backoff)
+            self._batch = max(self._batch // 2, self._min_bytes)
+        self._decisions.append({'time': time.time(), 'ok': ok, 'bytes': size, 'latency': latency,
+                                'batch_before': old, 'batch_after': self._batch})
+        if self._batch != old:
+            logging.info(f'Upload batch for {self._url} changed from {old} to {self._batch} bytes')
+
+    @property
+    def metrics(self):
+        """ Dictionary of upload metrics and the most recent batch size decisions. """
+        with self._cond:
+            return {'url': self._url,
+                    'batch_bytes': self._batch,
+                    'goodput_bps': self._goodput,
+                    'latency_s': self._latency,
+                    'posts': self._posts,
+                    'failures': self._failures,
+                    'bytes_sent': self._sent,
+                    'bytes_spooled': self._spooled,
+                    'bytes_queued': self._queued,
+                    'backoff_s': self._backoff,
+                    'decisions': list(self._decisions)}